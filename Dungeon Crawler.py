@@ -1,18 +1,25 @@
-import pygame, random, math, queue, os
+import pygame, random, math, os, time, argparse, struct, multiprocessing, mmap, csv, json, zlib
+import concurrent.futures
+import pathfinding
+import visibility
+import timerwheel
 
-from dataclasses import dataclass, field
-from typing import Any
+from enum import IntEnum
+from collections import OrderedDict, deque
+from array import array
 
-@dataclass(order=True)
-class PrioritizedItem():
-    priority: int
-    item: Any=field(compare=False)
-
-pygame.init()
 clock = pygame.time.Clock()
 
 size = (600, 600)
-screen = pygame.display.set_mode(size)
+screen = None
+
+#Directory the game is stored in, which every asset path is relative to
+baseDirectory = os.path.dirname(os.path.abspath(__file__))
+#Directory where scaled copies of images are saved
+assetCacheDirectory = os.path.join(baseDirectory, "assetCache")
+
+#Stores whether the game is running without a window, audio or frame cap
+headless = False
 
 #Constants
 rows = 30
@@ -20,6 +27,67 @@ columns = 30
 tileWidth = 10
 scale = 10
 
+#Smallest and largest width and height of a room
+minRoomSize = 8
+maxRoomSize = 10
+
+#Furthest distance (in steps) from the player that enemies can find their way from
+maxFlowDistance = 32
+#Distance stored within the flow field for tiles the player cannot be reached from
+unreachable = 0xFFFF
+#Number of tiles the player can see in every direction
+viewRadius = 3
+#When set, enemies stay where they are until the player has seen them. Otherwise
+#every enemy in a room hunts the player as soon as the room is activated
+enemiesWaitUntilSeen = False
+
+#Balance of the game, enemies get stronger and more numerous as the level count increases
+playerHitpoints = 30
+enemyBaseHitpoints = 2
+enemyHitpointsPerLevel = 1
+enemyPowerPerLevel = 1.3
+#Every room spawns between the fewest and most extra enemies, on top of the enemies for each level
+minExtraEnemies = 1
+maxExtraEnemies = 2
+enemiesPerLevel = 1
+
+#Number of tiles along each side of a pre-rendered chunk of the level
+layerChunkSize = 8
+#Maximum number of pre-rendered chunks kept in memory at once
+maxLayerChunks = 9
+#Maximum number of effects that can be shown at once
+maxEffects = 64
+#Maximum number of rendered pieces of text kept in memory at once
+maxCachedTexts = 64
+#Maximum number of changed areas of the screen tracked before the whole screen is redrawn
+maxDirtyRects = 32
+#Area at the top of the screen which the HUD is drawn within
+hudArea = pygame.Rect(0, 20, size[0], 50)
+#Number of recent timings of each phase of a frame kept by the profiler
+profileWindow = 600
+#Area at the bottom of the screen which the profiler's overlay is drawn within
+profileArea = pygame.Rect(10, 330, 330, 260)
+#Number of frames between each update of the numbers shown on the profiler's overlay
+profileOverlayInterval = 30
+
+#Number of times the game is updated every second, regardless of how often it is drawn
+tickRate = 60
+#Length of a single update in seconds
+tickDuration = 1 / tickRate
+#Highest number of frames drawn every second
+maxFrameRate = 60
+#Most updates run between two frames, so a slow frame does not cause the game
+#to fall further and further behind trying to catch up
+maxTicksPerFrame = 8
+#How much faster than normal the game runs, and how much faster it runs while fast forwarding
+timeScale = 1.0
+fastForwardScale = 4.0
+#Number of ticks between each of the player's moves and attacks, and between each enemy's actions
+playerActionInterval = 20
+enemyActionInterval = 31
+#Number of ticks each frame of an effect is shown for
+effectFrameTicks = 3
+
 #Buttons
 mainMenuButtons = ["play", "settings", "exit"]
 gameButtons = ["home"]
@@ -33,20 +101,135 @@ directions = {
     "down" : pygame.math.Vector2(0, 1)
 }
 
-#Stores different fonts in a dictionary
-fonts = {
-    "large" : pygame.font.SysFont(None, 48),
-    "medium" : pygame.font.SysFont(None, 24)
+#Stores the bit each direction sets within a tick's key mask, which holds
+#every direction being pressed during that tick as a single number
+directionBits = {
+    "left" : 1,
+    "right" : 2,
+    "up" : 4,
+    "down" : 8
+}
+
+#Stores the key which moves the player in each direction
+directionKeys = {
+    "left" : pygame.K_a,
+    "right" : pygame.K_d,
+    "up" : pygame.K_w,
+    "down" : pygame.K_s
 }
 
+#Stores different fonts in a dictionary, filled in once PyGame is initialised
+fonts = {}
+
+#Stores rendered text keyed by font, text and colour, ordered
+#from least to most recently used
+textCache = OrderedDict()
+
 #Init
-grid = []
+grid = None
 rooms = []
+#Stores the id of the room every tile is inside of plus 1, or 0 for tiles outside every room
+roomIndex = None
+#Stores the rooms which are active, the only rooms which need updating every tick
+activeRooms = []
+#Stores the number of rooms which have not been completed yet
+incompleteRoomCount = 0
+#Stores the room the player walked into during the last tick, which is activated at the start of the next one
+enteredRoom = None
 entities = []
-effects = []
+#Stores the state of every enemy within the level
+enemyStore = None
+#Maps the (x, y) position of every tile with an entity on it to that entity
+occupancy = {}
+#Wakes up every enemy on the tick of its next action
+scheduler = None
+#Stores the number of ticks played since the run started
+currentTick = 0
+#Stores every effect being shown
+effects = None
+#Stores the number of steps from every tile to the player, which
+#enemies follow downhill to reach the player
+flowField = None
+#Stores the grid and player position the flow field was last calculated for
+flowFieldGrid = None
+flowFieldOrigin = None
+#Stores the index of every tile the flow field reached, so that only those need resetting
+flowFieldReached = []
+#Stores 1 for every tile the player can currently see and for every tile the
+#player has seen since the level started
+visibleTiles = None
+exploredTiles = None
+#Stores the index of every tile the player can currently see, so that only those need resetting
+visibleList = []
+#Stores the player position the field of view was last calculated from, None when it is out of date
+fieldOfViewOrigin = None
+#Set when the field of view has changed since the screen was last redrawn for it
+fieldOfViewChanged = False
+#Stores pre-rendered chunks of the level's tiles keyed by the chunk's
+#position, ordered from least to most recently drawn
+layerChunks = OrderedDict()
+#Stores the areas of the screen that have changed since the screen was last updated
+dirtyRects = []
+#Set when the whole screen has to be redrawn, such as after switching menus
+fullRedraw = True
+#Stores the player position and HUD values at the time the game was last drawn
+cameraPosition = None
+hudState = None
 player = None
 levelCount = 1
 score = 0
+#Stores the total damage the player has taken since the run started
+damageTaken = 0
+#Set when every room has been completed, so the next level is started after the current update
+levelCompleted = False
+#Stores the seed of the current run, which every level's seed is made from
+runSeed = 0
+#Random number generator used for everything that decides what a level
+#looks like and where enemies spawn, seeded separately for each level
+levelRandom = random.Random()
+#Stores how many seconds the current level took to generate
+generationTime = 0
+
+#Pool of worker processes which generate upcoming levels in the background
+levelPool = None
+#Stores the run seed, level number and future of the level being generated in the background
+pendingLevel = None
+
+#Directory where generated levels are saved so they never have to be generated again
+levelCacheDirectory = os.path.join(baseDirectory, "levelCache")
+levelCacheEnabled = True
+#Maximum number of levels kept within the cache
+maxCachedLevels = 200
+#Bytes which every cached level file starts with, followed by the serialized level
+levelFileMagic = b"DCLV\x01"
+#Version of the level generator, which is part of every cached level's name. This must be
+#increased whenever a change to generation makes a seed produce a different level, so
+#levels made by an older generator are never loaded
+levelGeneratorVersion = 1
+
+#A serialized level starts with its number of columns, rows and rooms
+levelHeaderFormat = "<HHH"
+#followed by the x, y, width, height and door position of every room,
+#then the tile type id of every tile in the grid
+roomRecordFormat = "<HHHHHH"
+
+#Function which decides the player's direction instead of the keyboard,
+#used when the game is driven by a script or a bot
+directionProvider = None
+#Stores the directions pressed during the current tick as a key mask
+keyMask = 0
+
+#Marks the start of a recording of a run's input, followed by the version of the format
+recordingFileMagic = b"DCRP\x01"
+#Stores the run seed, then the number of ticks, state hashes and clicks which follow
+recordingHeaderFormat = "<QIII"
+#Stores the tick a click happened before and where the mouse was
+clickRecordFormat = "<IHH"
+
+#Raised when the player dies while running headless so the
+#simulation can carry on with a new game
+class GameOver(Exception):
+    pass
 
 #Stores the list of all tile types which entities cannot walk through
 collidable = ["wall", "border", "player", "lockedDoor", "enemy"]
@@ -54,16 +237,129 @@ collidable = ["wall", "border", "player", "lockedDoor", "enemy"]
 #Stores all the different tile types within a list
 tileTypesList = ["wall", "border", "floor", "player", "door", "lockedDoor", "enemy"]
 
-#Creates an empty dictionary for tile types
-tileTypes = {}
-#Iterates through each tileType within tileTypesList
-for tileType in tileTypesList:
-    #Forms the directory for the image of the tile to be accessed through concatenation
-    directory = "tiles/" + tileType + ".png"
-    #Loads the image from the directory and scales it to a resolution of tileWidth x tileWidth pixels
-    sprite = pygame.transform.scale(pygame.image.load(directory), (tileWidth * scale, tileWidth * scale))
-    #Stores the sprite into the dictionary where its key is the name of the tileType
-    tileTypes[tileType] = sprite
+#Numeric ids of the tile types, in the same order as tileTypesList,
+#which is how tiles are stored within the grid
+class TileType(IntEnum):
+    WALL = 0
+    BORDER = 1
+    FLOOR = 2
+    PLAYER = 3
+    DOOR = 4
+    LOCKED_DOOR = 5
+    ENEMY = 6
+
+#Maps the name of a tile type to its id
+tileTypeIds = {tileType : i for i, tileType in enumerate(tileTypesList)}
+
+#Lookup table which stores 1 for every collidable tile type id and 0 otherwise.
+#It covers all 256 byte values so that it can be used with bytearray.translate()
+collidableTable = bytearray(256)
+for tileType in collidable:
+    collidableTable[tileTypeIds[tileType]] = 1
+
+#Stores the list of all tile types which block the player's sight
+opaque = ["wall", "border", "lockedDoor"]
+
+#Lookup table which stores 1 for every tile type id which blocks sight and 0 otherwise
+opaqueTable = bytearray(256)
+for tileType in opaque:
+    opaqueTable[tileTypeIds[tileType]] = 1
+
+#Stores the cost of walking through each tile type when carving corridors
+tileCosts = {
+    "floor" : 1,
+    "wall" : 5,
+    "border" : 999,
+    "door" : 1,
+    "lockedDoor" : 999
+}
+
+#Lookup table of tile costs indexed by tile type id
+costTable = [tileCosts.get(tileType, 1) for tileType in tileTypesList]
+
+#The asset cache is a dictionary which loads each asset the
+#first time it is accessed, using the loader function given
+class AssetCache(dict):
+    def __init__(self, loader):
+        super().__init__()
+        self.loader = loader
+
+    def __missing__(self, key):
+        asset = self.loader(key)
+        self[key] = asset
+        return asset
+
+#Stores the full path of every asset path that has been resolved
+resolvedPaths = {}
+
+#Gets the full path of an asset from the folders and file name leading to it
+def resolveAssetPath(*parts):
+    path = resolvedPaths.get(parts)
+    if path: return path
+
+    path = baseDirectory
+    for part in parts:
+        candidate = os.path.join(path, part)
+        if not os.path.exists(candidate):
+            #Looks for the file or folder with different capitalisation,
+            #as some file systems are case sensitive and others are not
+            matches = [name for name in os.listdir(path) if name.lower() == part.lower()]
+            if not matches: raise FileNotFoundError("Missing asset: " + "/".join(parts))
+            candidate = os.path.join(path, matches[0])
+        path = candidate
+
+    resolvedPaths[parts] = path
+    return path
+
+#Loads an image scaled to a resolution of tileWidth x tileWidth pixels, using
+#the scaled copy saved within the asset cache directory if there is one
+def loadScaledImage(*parts):
+    path = resolveAssetPath(*parts)
+    imageSize = (tileWidth * scale, tileWidth * scale)
+
+    #The scaled copy is named after the image, its size and the time the image was
+    #last changed, so it is never used after the image is edited or the scale changes
+    name = "-".join(parts) + "-" + str(imageSize[0]) + "x" + str(imageSize[1])
+    cachePath = os.path.join(assetCacheDirectory, name + "-" + str(os.stat(path).st_mtime_ns) + ".raw")
+
+    try:
+        with open(cachePath, "rb") as file:
+            sprite = pygame.image.frombytes(file.read(), imageSize, "RGBA")
+    except (OSError, ValueError):
+        sprite = pygame.transform.scale(pygame.image.load(path), imageSize)
+        saveScaledImage(sprite, cachePath, name)
+
+    #Converts the sprite to the display's pixel format so that
+    #it does not have to be converted every time it is drawn
+    if pygame.display.get_surface():
+        sprite = sprite.convert_alpha()
+    return sprite
+
+#Saves the pixels of a scaled image, replacing any older copies of it
+def saveScaledImage(sprite, cachePath, name):
+    try:
+        os.makedirs(assetCacheDirectory, exist_ok=True)
+        for oldName in os.listdir(assetCacheDirectory):
+            if oldName.startswith(name + "-"):
+                os.remove(os.path.join(assetCacheDirectory, oldName))
+        with open(cachePath, "wb") as file:
+            file.write(pygame.image.tobytes(sprite, "RGBA"))
+    except OSError:
+        #The image is scaled again next time instead
+        pass
+
+def loadTileSprite(tileType):
+    return loadScaledImage("tiles", tileType + ".png")
+
+def loadEffectFrames(effectType):
+    #Loads every frame within the effect's folder
+    return [loadScaledImage("effects", effectType, str(i) + ".png") for i in range(effectTypesList[effectType])]
+
+def loadSound(soundName):
+    return pygame.mixer.Sound(resolveAssetPath("sfx", soundName + ".wav"))
+
+#Stores the sprite of each tile type, loaded when first drawn
+tileTypes = AssetCache(loadTileSprite)
 
 #Stores the list of all effect names and the number of frames they have
 effectTypesList = {
@@ -71,45 +367,113 @@ effectTypesList = {
     "death" : 4
 }
 
-#Creates an empty dictionary for effects to be stored within
-effectTypes = {}
-
-#Loads all the effects and organises them into a dictionary for later use
-for effectType in effectTypesList:
-    #Gets the number of frames of a particular type of effect
-    numberOfFrames = effectTypesList[effectType]
-    #Creates a list within the dictionary for the frames of the effect to be stored
-    effectTypes[effectType] = []
-    #Concatenates strings to form the directory of the folder which holds the effect frames
-    folderDirectory = "effects/" + effectType + "/"
-    #Loops through the individual frames within the folder
-    for i in range(numberOfFrames):
-        #Concatenates strings to form the directory of a frame 
-        directory = folderDirectory + str(i) + ".png"
-        #Loads the image from the directory as well as scaling the image to a resolution of tileWidth x tileWidth pixels
-        sprite = pygame.transform.scale(pygame.image.load(directory), (tileWidth * scale, tileWidth * scale))
-        #Stores the loaded sprite into the effectTypes dictionary 
-        effectTypes[effectType].append(sprite)
+#Stores the frames of each effect, loaded when first shown
+effectTypes = AssetCache(loadEffectFrames)
 
 #Stores list of sound names
 soundNames = ["hit", "death", "roomComplete", "roomEnter"]
 
-#Creates an empty dictionary for sound effects to be stored within
-sounds = {}
-
-#Loads all sound effects into the sounds dictionary
-for soundName in soundNames:
-    #Forms the directory for the particular sound to be loaded
-    directory = "sfx/" + soundName + ".wav"
-    #Stores the sound within the dictionary as a PyGame sound object
-    sounds[soundName] = pygame.mixer.Sound(directory)
-
-#Loads music
-pygame.mixer.music.load("music.mp3")
-#Adjusts volume
-pygame.mixer.music.set_volume(0.2)
-#Plays music infinitely
-pygame.mixer.music.play(-1)
+#Stores each sound effect, decoded once when the audio manager is set up
+sounds = AssetCache(loadSound)
+
+#Stores the category of every sound effect, each category plays on its own channels
+soundCategories = {"hit" : "combat", "death" : "combat", "roomComplete" : "ui", "roomEnter" : "ui"}
+#Number of mixer channels reserved for each category of sound effect, which is the
+#most sounds of that category that can be heard at once
+channelGroupSizes = {"combat" : 6, "ui" : 2}
+#Fewest milliseconds between two plays of the same sound, plays sooner than this are dropped
+minSoundInterval = 40
+
+#Sample rate, sample size, number of speakers and buffer size the mixer is set up with.
+#A small buffer keeps the delay between something happening and its sound being heard short
+mixerFrequency = 44100
+mixerSampleSize = -16
+mixerChannels = 2
+mixerBufferSize = 512
+
+#The texture atlas packs every tile sprite and effect frame into a single
+#surface, so that everything can be drawn from one surface by a single
+#call to blits using the area of the atlas each sprite is stored in
+class TextureAtlas():
+    def __init__(self):
+        tileSize = tileWidth * scale
+        #Stores every sprite along with its name, effect frames are named by their effect and frame
+        sprites = [(tileType, tileTypes[tileType]) for tileType in tileTypesList]
+        for effectType in effectTypesList:
+            sprites += [((effectType, i), frame) for i, frame in enumerate(effectTypes[effectType])]
+
+        #Lays the sprites out in rows, making the atlas as close to square as possible
+        atlasColumns = math.ceil(math.sqrt(len(sprites)))
+        atlasRows = math.ceil(len(sprites) / atlasColumns)
+        self.surface = pygame.Surface((atlasColumns * tileSize, atlasRows * tileSize), pygame.SRCALPHA)
+
+        #Stores the area of the atlas each sprite is stored in
+        self.rects = {}
+        for i, (name, sprite) in enumerate(sprites):
+            row, col = divmod(i, atlasColumns)
+            rect = pygame.Rect(col * tileSize, row * tileSize, tileSize, tileSize)
+            #Adding onto the transparent atlas copies the sprite's pixels exactly
+            self.surface.blit(sprite, rect, special_flags=pygame.BLEND_RGBA_ADD)
+            self.rects[name] = rect
+
+        if pygame.display.get_surface():
+            self.surface = self.surface.convert_alpha()
+
+        #Stores the area of each tile type in the order of their ids, so the
+        #tiles of the grid can be looked up without converting to names
+        self.tileRects = [self.rects[tileType] for tileType in tileTypesList]
+        #Stores the areas of every frame of each effect
+        self.effectRects = {effectType : [self.rects[(effectType, i)] for i in range(frameCount)]
+                            for effectType, frameCount in effectTypesList.items()}
+
+#Stores the texture atlas, which is built the first time it is used
+atlas = None
+
+def getAtlas():
+    global atlas
+    if not atlas:
+        atlas = TextureAtlas()
+    return atlas
+
+def playMusic():
+    #Loads music
+    pygame.mixer.music.load(resolveAssetPath("music.mp3"))
+    #Adjusts volume
+    pygame.mixer.music.set_volume(0.2)
+    #Plays music infinitely
+    pygame.mixer.music.play(-1)
+
+#Initialises PyGame, the window and the music. This is kept out of the
+#module's top level so that importing the game does not open a window
+def initPygame(headlessMode=False):
+    global screen, headless, audio
+
+    headless = headlessMode
+    #SDL's dummy drivers let the game run without a display or sound card,
+    #they must be selected before PyGame is initialised
+    if headless:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+    #The mixer's settings only take effect if they are chosen before PyGame is initialised
+    pygame.mixer.pre_init(mixerFrequency, mixerSampleSize, mixerChannels, mixerBufferSize)
+    pygame.init()
+    screen = pygame.display.set_mode(size)
+
+    fonts["large"] = pygame.font.SysFont(None, 48)
+    fonts["medium"] = pygame.font.SysFont(None, 24)
+    fonts["small"] = pygame.font.SysFont(None, 20)
+
+    #Tiles which have been seen before are shown darkened, unseen tiles are not shown at all
+    tileSize = tileWidth * scale
+    fogSurfaces["explored"] = pygame.Surface((tileSize, tileSize), pygame.SRCALPHA)
+    fogSurfaces["explored"].fill((0, 0, 0, 160))
+    fogSurfaces["unexplored"] = pygame.Surface((tileSize, tileSize))
+
+    #Music and sound effects are never played in headless mode, every other asset is loaded when it is first used
+    if not headless and pygame.mixer.get_init():
+        playMusic()
+        audio = AudioManager()
 
 musicEnabled = True
 soundEnabled = True
@@ -121,18 +485,13 @@ class Tile():
         self.tileType = tileType
 
     def getSprite(self):
-        #Fetches the sprite from the tileTypes dictionary
-        return tileTypes[self.tileType]
-
-    #Draws tile
-    def draw(self):
-        #Stores the result of the player being within bounds
-        #as a boolean
-        xInBounds = player.x - 3 <= self.x <= player.x + 3
-        yInBounds = player.y - 3 <= self.y <= player.y + 3
-        #If both conditions are not met, then do not
-        #draw the tile
-        if not(xInBounds and yInBounds): return
+        #Fetches the area of the atlas the tile's sprite is stored in
+        return getAtlas().rects[self.tileType]
+
+    #Adds the tile to the list of sprites to be drawn
+    def draw(self, drawList):
+        #Only tiles the player can see are drawn
+        if not visibleTiles[self.y * columns + self.x]: return
         
         #Calls the getSprite method to fetch the tile's sprite
         sprite = self.getSprite()
@@ -141,59 +500,171 @@ class Tile():
         #Converts the 2D array coordinates to position measured in pixels
         position = (self.x * tileWidth * scale + offset.x, self.y * tileWidth * scale + offset.y)
         #Draws the sprite at specified position
-        screen.blit(sprite, position)
+        drawList.append((atlas.surface, position, sprite))
+
+#The grid class stores the tile type id of every tile in the level
+#within a single flat bytearray rather than as individual objects
+class Grid():
+    def __init__(self, columns, rows, tileType=TileType.WALL):
+        self.columns = columns
+        self.rows = rows
+        #Every tile takes up a single byte, stored row by row
+        self.cells = bytearray([tileType]) * (columns * rows)
+
+    #Converts coordinates into a position within the cells bytearray
+    def index(self, x, y):
+        return y * self.columns + x
+
+    def getType(self, x, y):
+        return self.cells[y * self.columns + x]
+
+    def setType(self, x, y, tileType):
+        self.cells[y * self.columns + x] = tileType
+
+    #Sets the tile type of every tile within a rectangle
+    def fill(self, x, y, width, height, tileType):
+        #Each row of the rectangle is assigned as a single slice
+        rowCells = bytes([tileType]) * width
+        for row in range(y, y + height):
+            start = row * self.columns + x
+            self.cells[start:start + width] = rowCells
+
+    def isCollidable(self, x, y):
+        return collidableTable[self.cells[y * self.columns + x]] == 1
+
+    #Returns a tile object which reads and writes to this grid
+    def getTile(self, x, y):
+        return GridTile(self, x, y)
+
+    #Gets the first non-collidable tile
+    def findFirstEmpty(self):
+        #Translates every cell into 1 if it is collidable and 0 if it is not
+        #in a single pass, then searches for the first 0
+        index = self.cells.translate(collidableTable).find(0)
+        if index == -1: return None
+        return self.getTile(index % self.columns, index // self.columns)
+
+#The grid tile class is a thin view of a single tile stored within
+#a grid, so code can still work with tile objects where it needs to
+class GridTile(Tile):
+    def __init__(self, grid, x, y):
+        self.grid = grid
+        self.x = x
+        self.y = y
 
-    def getNeighbours(self):
-        neighbours = []
-        for direction in directions.items():
-            xNew = int(self.x + direction[1].x)
-            yNew = int(self.y + direction[1].y)
-            
-            xInBounds = 1 <= xNew <= columns - 2
-            yInBounds = 1 <= yNew <= rows - 2
+    #The tile type is read from and written to the grid by name
+    @property
+    def tileType(self):
+        return tileTypesList[self.grid.getType(self.x, self.y)]
+
+    @tileType.setter
+    def tileType(self, tileType):
+        self.grid.setType(self.x, self.y, tileTypeIds[tileType])
+
+    #Views of the same position are treated as the same tile
+    def __eq__(self, other):
+        return isinstance(other, GridTile) and self.x == other.x and self.y == other.y
+
+    def __hash__(self):
+        return hash((self.x, self.y))
+
+#The effect pool stores every effect being shown within preallocated
+#arrays used as a ring buffer, so effects can be created and removed
+#without allocating objects
+class EffectPool():
+    def __init__(self, capacity):
+        self.capacity = capacity
+        #Stores the slot of the oldest effect and the number of effects
+        self.head = 0
+        self.count = 0
+
+        self.x = array("i", [0]) * capacity
+        self.y = array("i", [0]) * capacity
+        #Stores the number of times the pool has been updated, which effects are timed
+        #by, so an effect added before the pool is updated on a tick counts that tick
+        self.tick = 0
+        #Stores the tick of the pool each effect disappears on
+        self.expiryTicks = array("q", [0]) * capacity
+        #Stores the earliest tick any effect disappears on, the pool is left alone until then
+        self.nextExpiryTick = 0
+        #Stores the list of atlas areas of the frames each effect cycles
+        #through, which is shared between every effect of the same type
+        self.frames = [None] * capacity
+
+    def add(self, x, y, frames):
+        #Replaces the oldest effect when the pool is full
+        if self.count == self.capacity:
+            markTileDirty(self.x[self.head], self.y[self.head])
+            self.head = (self.head + 1) % self.capacity
+            self.count -= 1
+
+        slot = (self.head + self.count) % self.capacity
+        self.x[slot] = x
+        self.y[slot] = y
+        #Stores when the effect disappears based on the number of frames
+        expiryTick = self.tick + len(frames) * effectFrameTicks
+        self.expiryTicks[slot] = expiryTick
+        if self.count == 0 or expiryTick < self.nextExpiryTick:
+            self.nextExpiryTick = expiryTick
+        self.frames[slot] = frames
+        self.count += 1
 
-            if not (xInBounds and yInBounds): continue
-            
-            neighbourTile = grid[yNew][xNew]
-            neighbours.append(neighbourTile)
-            
-        return neighbours
-
-    def getCost(self):
-        if self.tileType == "floor":
-            return 1
-        elif self.tileType == "wall":
-            return 5
-        elif self.tileType == "border":
-            return 999
-
-class Effect(Tile):
-    def __init__(self, x, y, tileType, frames):
-        #Inherits method and attributes from the tile class
-        super().__init__(x, y, tileType)
-
-        #Stores the frames that the object will cycle through
-        #throughout its lifetime
-        self.frames = frames.copy()
+    def update(self):
+        self.tick += 1
+        #Nothing changes until the first effect disappears
+        if self.count == 0 or self.tick < self.nextExpiryTick: return
+
+        #Moves the effects that are still going to the front of the pool in the same pass
+        kept = 0
+        nextExpiryTick = None
+        for i in range(self.count):
+            slot = (self.head + i) % self.capacity
+            expiryTick = self.expiryTicks[slot]
+            #If the effect's time is up then it is left out
+            if expiryTick <= self.tick:
+                #Makes sure the last frame of the effect gets drawn over
+                markTileDirty(self.x[slot], self.y[slot])
+                self.frames[slot] = None
+                continue
+
+            keptSlot = (self.head + kept) % self.capacity
+            if keptSlot != slot:
+                self.x[keptSlot] = self.x[slot]
+                self.y[keptSlot] = self.y[slot]
+                self.expiryTicks[keptSlot] = expiryTick
+                self.frames[keptSlot] = self.frames[slot]
+                self.frames[slot] = None
+            if nextExpiryTick is None or expiryTick < nextExpiryTick:
+                nextExpiryTick = expiryTick
+            kept += 1
+        self.count = kept
+        if nextExpiryTick is not None:
+            self.nextExpiryTick = nextExpiryTick
+
+    #Marks the tile of every effect as needing to be redrawn
+    def markTilesDirty(self):
+        for i in range(self.count):
+            slot = (self.head + i) % self.capacity
+            markTileDirty(self.x[slot], self.y[slot])
+
+    #Adds every effect near the player to the list of sprites to be drawn
+    def draw(self, drawList):
+        tileSize = tileWidth * scale
+        offset = getOffset()
+        surface = getAtlas().surface
 
-        #Stores the lifetime of the effect based on the number of frames
-        self.timer = len(self.frames) * 3
-        self.initialTimer = self.timer
+        for i in range(self.count):
+            slot = (self.head + i) % self.capacity
+            x = self.x[slot]
+            y = self.y[slot]
+            if not visibleTiles[y * columns + x]: continue
 
-    def getSprite(self):
-        #Get the current frame of the effect relative to how long the effect
-        #has been around for
-        frame = (self.initialTimer - self.timer) // 3
-        #Returns the sprite that has been fetched
-        return self.frames[frame]
+            #Gets the current frame of the effect relative to how long the effect
+            #has been around for
+            frames = self.frames[slot]
+            frame = (len(frames) * effectFrameTicks - (self.expiryTicks[slot] - self.tick)) // effectFrameTicks
+            drawList.append((surface, (x * tileSize + offset.x, y * tileSize + offset.y), frames[frame]))
 
-    def update(self):
-        #Decrements the timer
-        self.timer -= 1
-        #If the timer has reached 0 then remove the effect from the game
-        if self.timer <= 0:
-            effects.remove(self)
-        
 #The entity class defines an object which can move around
 #the level and attack other entities. It inherits methods
 #and attributes from the tile class.
@@ -214,29 +685,45 @@ class Entity(Tile):
 
     #Moves the entity in a direction
     def move(self, direction):
+        #Removes the entity from its old position in the occupancy map
+        self.vacate()
         #Sets the x attribute of the entity according to the
         #x component of the direction vector object
         self.x += int(direction.x)
         #Sets the y attribute of the entity according to the
         #y component of the direction vector object
         self.y += int(direction.y)
+        #Stores the entity at its new position in the occupancy map
+        self.occupy()
+
+    #Records the entity's position within the occupancy map
+    def occupy(self):
+        occupancy[(self.x, self.y)] = self
+        markTileDirty(self.x, self.y)
+
+    #Removes the entity's position from the occupancy map
+    def vacate(self):
+        if occupancy.get((self.x, self.y)) is self:
+            del occupancy[(self.x, self.y)]
+            markTileDirty(self.x, self.y)
 
     def getTargetEntity(self, direction):
-        x = self.x + direction.x
-        y = self.y + direction.y
-        for entity in entities:
-            if entity.x == x and entity.y == y:
-                return entity
+        x = self.x + int(direction.x)
+        y = self.y + int(direction.y)
+        return occupancy.get((x, y))
 
     def willCollide(self, x, y):
-        for entity in entities:
-            if entity.x == x and entity.y == y and entity != self:
-                return True
-        return False
+        entity = occupancy.get((x, y))
+        return entity is not None and entity != self
 
     def attack(self, targetEntity):
+        global damageTaken
+
         #Deducts hitpoints from the target entity
         targetEntity.hitpoints -= self.power
+        #Keeps track of how much damage the player has taken during the run
+        if targetEntity is player:
+            damageTaken += self.power
         #Calls the create effect function
         createEffect(targetEntity.x, targetEntity.y, "hit")
         #Plays hit sound
@@ -244,46 +731,157 @@ class Entity(Tile):
         
 #The enemy class defines the enemy object which inherits
 #methods and attributes from the entity class
+
+#The enemy store holds the state of every enemy within parallel arrays,
+#so that all enemies can be updated together in a single pass each tick
+class EnemyStore():
+    def __init__(self):
+        #Stores the enemy objects in the same order as the arrays
+        self.enemies = []
+
+        self.x = array("i")
+        self.y = array("i")
+        self.hitpoints = array("i")
+        self.power = array("i")
+        #Stores the tick of every enemy's next action
+        self.actionTicks = array("q")
+        self.roomIds = array("i")
+        #Stores 1 for every enemy which has seen the player, 0 until then
+        self.aware = bytearray()
+
+        #Stores enemies whose hitpoints have dropped to 0 since the last update
+        self.dying = []
+
+        #Lists every array, which all have a value for each enemy
+        self.columns = [self.x, self.y, self.hitpoints, self.power, self.actionTicks, self.roomIds, self.aware]
+
+    #Adds a slot for a new enemy's state, returning the slot's index
+    def add(self, enemy, roomId):
+        self.enemies.append(enemy)
+        for column in self.columns:
+            column.append(0)
+        self.roomIds[-1] = roomId
+        return len(self.enemies) - 1
+
+    #Removes an enemy by moving the last enemy into its slot
+    def remove(self, enemy):
+        slot = enemy.slot
+        lastSlot = len(self.enemies) - 1
+        if slot != lastSlot:
+            lastEnemy = self.enemies[lastSlot]
+            self.enemies[slot] = lastEnemy
+            lastEnemy.slot = slot
+            for column in self.columns:
+                column[slot] = column[lastSlot]
+
+        self.enemies.pop()
+        for column in self.columns:
+            column.pop()
+        enemy.slot = None
+
+    def update(self):
+        #Removes every enemy that has been killed
+        for enemy in self.dying:
+            #Enemies hit more than once are listed more than once
+            if enemy.slot is not None:
+                enemy.die()
+        self.dying.clear()
+
+        #Only the enemies due to act this tick are woken up. Enemies which have died
+        #since being scheduled, or have been scheduled again for later, are skipped
+        for enemy in scheduler.advance(currentTick):
+            if enemy.slot is None or self.actionTicks[enemy.slot] > currentTick: continue
+            #Calls the decide action method
+            enemy.decideAction()
+
+#Creates a property which reads and writes one of the enemy store's arrays
+#at the enemy's slot, rather than storing the value on the enemy object
+def storedAttribute(columnName):
+    def getValue(self):
+        return getattr(enemyStore, columnName)[self.slot]
+
+    def setValue(self, value):
+        getattr(enemyStore, columnName)[self.slot] = value
+
+    return property(getValue, setValue)
+
 class Enemy(Entity):
+    #The enemy's state is kept within the enemy store
+    x = storedAttribute("x")
+    y = storedAttribute("y")
+    power = storedAttribute("power")
+    actionTick = storedAttribute("actionTicks")
+    aware = storedAttribute("aware")
+
     def __init__(self, x, y, tileType, room):
+        #Reserves a slot within the enemy store for the enemy's state
+        self.slot = enemyStore.add(self, room.id)
         #Inherits methods and attributes from parent class
         super().__init__(x, y, tileType)
         #Ensures tile type is "enemy"
         self.tileType = "enemy"
-        #Stores the room the enemy has spawned 
-        self.room = room
-        #Cooldown for enemy movement/attacks
-        self.actionTimer = 30
+        #Cooldown for enemy movement/attacks. Enemies are spawned while the rooms are updated, before
+        #the enemies are, so the tick they spawn on counts towards their first cooldown
+        self.scheduleAction(enemyActionInterval - 1)
 
         #Set attributes of the enemy according to the level count
         global levelCount
-        self.hitpoints = math.ceil(2 + 1 * levelCount)
-        self.power = math.ceil(1.3 * levelCount)
-
-    def update(self):
+        self.hitpoints = math.ceil(enemyBaseHitpoints + enemyHitpointsPerLevel * levelCount)
+        self.power = math.ceil(enemyPowerPerLevel * levelCount)
+
+    @property
+    def hitpoints(self):
+        return enemyStore.hitpoints[self.slot]
+
+    @hitpoints.setter
+    def hitpoints(self, value):
+        enemyStore.hitpoints[self.slot] = value
+        #Lets the enemy store know to remove the enemy
+        if value <= 0:
+            enemyStore.dying.append(self)
+
+    #Stores the room the enemy has spawned within
+    @property
+    def room(self):
+        return rooms[enemyStore.roomIds[self.slot]]
+
+    def die(self):
         global score
-        
-        if self.actionTimer > 0:
-            #Decrements the action timer
-            self.actionTimer -= 1
-        else:
-            #Calls the decide action method
-            self.decideAction()
 
-        if self.hitpoints <= 0:
-            #Create death effect
-            createEffect(self.x, self.y, "death")
-            #Plays death sound
-            playSound("death")
-            #Remove all references of enemy
-            entities.remove(self)
-            self.room.enemies.remove(self)
-
-            #Increase score when the enemy dies
-            #Score increase depends on the level count
-            score += 200 + 100 * levelCount
+        #Create death effect
+        createEffect(self.x, self.y, "death")
+        #Plays death sound
+        playSound("death")
+        #Remove all references of enemy
+        self.vacate()
+        self.room.enemyCount -= 1
+        enemyStore.remove(self)
+
+        #Increase score when the enemy dies
+        #Score increase depends on the level count
+        score += 200 + 100 * levelCount
 
     def getDirection(self):
+        updateFlowField()
+
+        #Moves to the neighbouring tile closest to the player
+        #that another enemy is not standing on
+        index = grid.index(self.x, self.y)
+        bestDirection = None
+        bestDistance = flowField[index]
+        for direction in directions.values():
+            x = self.x + int(direction.x)
+            y = self.y + int(direction.y)
+            distance = flowField[index + int(direction.x) + int(direction.y) * columns]
+            if distance < bestDistance and not isinstance(occupancy.get((x, y)), Enemy):
+                bestDirection = direction
+                bestDistance = distance
+
+        if bestDirection: return bestDirection
+        #Heads straight for the player if the flow field cannot help
+        return self.getGreedyDirection()
+
+    def getGreedyDirection(self):
         #Returns a vector based on the player's
         #position from the enemy
         if self.x > player.x:
@@ -295,17 +893,30 @@ class Enemy(Entity):
         elif self.y > player.y:
             return directions["up"]
 
+    #Wakes the enemy up again once its cooldown is over
+    def scheduleAction(self, interval):
+        self.actionTick = currentTick + interval
+        scheduler.schedule(self.actionTick, self)
+
     def decideAction(self):
-        #Resets the action timer
-        self.actionTimer = 30
+        #Schedules the next action
+        self.scheduleAction(enemyActionInterval)
+        #Enemies stay where they are until they have been within the player's sight,
+        #as the player can see any enemy that can see them
+        if not self.aware:
+            #The screen is redrawn for the new field of view once the update has finished
+            refreshFieldOfView()
+            if not visibleTiles[self.y * columns + self.x]: return
+            self.aware = 1
         #Gets direction of the player
         direction = self.getDirection()
         #Gets the target entity
         targetEntity = self.getTargetEntity(direction)
-        #Gets the tile at that direction
-        nextTile = grid[int(self.y + direction.y)][int(self.x + direction.x)]
-        #Checks if the enemy will collide with another entity at that tile's position
-        if self.willCollide(nextTile.x, nextTile.y):
+        #Gets the position at that direction
+        x = int(self.x + direction.x)
+        y = int(self.y + direction.y)
+        #Checks if the enemy will collide with another entity at that position
+        if self.willCollide(x, y):
             #If it does and the entity it has collided into is a player
             if targetEntity == player:
                 #Then call the attack method while passing in the player object
@@ -314,11 +925,88 @@ class Enemy(Entity):
             #Calls the move method with the direction calculated
             self.move(direction)
 
+#Recalculates the distance of every tile near the player from the player,
+#which only needs doing when the player has moved onto a different tile
+def updateFlowField():
+    global flowField, flowFieldGrid, flowFieldOrigin
+
+    if flowFieldGrid is grid and flowFieldOrigin == (player.x, player.y): return
+
+    if flowFieldGrid is not grid:
+        #A new level needs a new flow field the size of its grid
+        flowField = array("H", [unreachable]) * len(grid.cells)
+        flowFieldGrid = grid
+    else:
+        #Only the tiles reached last time need to be reset
+        for index in flowFieldReached:
+            flowField[index] = unreachable
+    flowFieldReached.clear()
+    flowFieldOrigin = (player.x, player.y)
+
+    cells = grid.cells
+    offsets = (-1, 1, -grid.columns, grid.columns)
+    start = grid.index(player.x, player.y)
+    flowField[start] = 0
+    flowFieldReached.append(start)
+
+    #Breadth first search outwards from the player through non-collidable tiles.
+    #The edges of the grid are always walls so the search never leaves the grid
+    frontier = [start]
+    for distance in range(1, maxFlowDistance + 1):
+        nextFrontier = []
+        for index in frontier:
+            for offset in offsets:
+                nextIndex = index + offset
+                if flowField[nextIndex] != unreachable or collidableTable[cells[nextIndex]]: continue
+                flowField[nextIndex] = distance
+                nextFrontier.append(nextIndex)
+        if not nextFrontier: break
+        flowFieldReached.extend(nextFrontier)
+        frontier = nextFrontier
+
+#Clears the field of view and every tile explored, ready for a new level
+def resetFieldOfView():
+    global visibleTiles, exploredTiles, fieldOfViewOrigin
+
+    visibleTiles = bytearray(columns * rows)
+    exploredTiles = bytearray(columns * rows)
+    visibleList.clear()
+    fieldOfViewOrigin = None
+
+#Makes the field of view be calculated again, such as after a door opens or closes
+def invalidateFieldOfView():
+    global fieldOfViewOrigin
+    fieldOfViewOrigin = None
+
+#Recalculates which tiles the player can see, which only needs doing when
+#the player has moved onto a different tile or a door has changed
+def refreshFieldOfView():
+    global fieldOfViewOrigin, fieldOfViewChanged
+
+    if fieldOfViewOrigin == (player.x, player.y): return
+    fieldOfViewOrigin = (player.x, player.y)
+
+    for index in visibleList:
+        visibleTiles[index] = 0
+    visibleList[:] = visibility.getVisibleTiles(grid.cells, columns, rows, player.x, player.y, viewRadius, opaqueTable)
+    for index in visibleList:
+        visibleTiles[index] = 1
+        exploredTiles[index] = 1
+    fieldOfViewChanged = True
+
+#Brings the field of view up to date, redrawing the screen once the tiles shown have changed
+def updateFieldOfView():
+    global fieldOfViewChanged
+
+    refreshFieldOfView()
+    if fieldOfViewChanged:
+        fieldOfViewChanged = False
+        #The tiles shown on the screen have changed
+        redrawScreen()
+
 def createEffect(x, y, effectType):
-    #Creates effect object at the given coordinates
-    effect = Effect(x, y, "effect", effectTypes[effectType])
-    #Stores the effect in a list as a reference
-    effects.append(effect)
+    #Adds an effect to the pool at the given coordinates
+    effects.add(x, y, getAtlas().effectRects[effectType])
         
 #The player class defines the player object which inherits
 #methods and attributes from the entity class. It also
@@ -335,59 +1023,46 @@ class Player(Entity):
         #correctly
         self.tileType = "player"
 
-        #This attribute is used as a cooldown on moving the player
-        self.moveTimer = 20
-        self.attackTimer = 20
+        #These attributes store the first tick the player can move and attack on
+        self.moveReadyTick = currentTick + playerActionInterval
+        self.attackReadyTick = currentTick + playerActionInterval
 
         #Redefines hitpoints for the player
-        self.maxHitpoints = 30
+        self.maxHitpoints = playerHitpoints
         self.hitpoints = self.maxHitpoints
 
     #Gets the player's movement-related key presses
     #and executes methods depending on the input
     def getDirection(self):
         direction = None
-        #Gets all the keys pressed and executes
+        #Gets the directions pressed during this tick and executes
         #the move method with the direction associated
         #with it (the direction depends on the particular
         #key pressed)
-        keys = pygame.key.get_pressed()
-        if keys[pygame.K_a]:
-            direction = directions["left"]
-        if keys[pygame.K_d]:
-            direction = directions["right"]
-        if keys[pygame.K_w]:
-            direction = directions["up"]
-        if keys[pygame.K_s]:
-            direction = directions["down"]
+        for directionName in directionBits:
+            if keyMask & directionBits[directionName]:
+                direction = directions[directionName]
         return direction
 
     
     def doAction(self):
-        #Decrements the cooldowns 
-        if self.moveTimer > 0:
-            self.moveTimer -= 1
-
-        if self.attackTimer > 0:
-            self.attackTimer -= 1
-
         #Gets direction based on player input
         direction = self.getDirection()
         if direction:
             #Gets the entity that the player may walk into
             targetEntity = self.getTargetEntity(direction)
             #If the entity does not exist then move towards direction
-            if self.moveTimer <= 0 and not targetEntity:
-                #moveTimer attribute set to 20 once the
-                #player moves
-                self.moveTimer = 20
+            if currentTick >= self.moveReadyTick and not targetEntity:
+                #The player can move again a set number
+                #of ticks after moving
+                self.moveReadyTick = currentTick + playerActionInterval
                 #Calls move method
                 self.move(direction)
             #If the entity does exist then attack entity towards direction
-            elif self.attackTimer <= 0 and targetEntity:
-                #attackTimer attribute set to 20 once
-                #the player attacks
-                self.attackTimer = 20
+            elif currentTick >= self.attackReadyTick and targetEntity:
+                #The player can attack again a set number
+                #of ticks after attacking
+                self.attackReadyTick = currentTick + playerActionInterval
                 #Calls the attack method
                 self.attack(targetEntity)
 
@@ -395,86 +1070,93 @@ class Player(Entity):
     #to account for collisions with walls
     #and the movement cooldown
     def move(self, direction):
-        self.x += int(direction.x)
-        self.y += int(direction.y)
+        x = self.x + int(direction.x)
+        y = self.y + int(direction.y)
 
-        #Gets the tile from the 2D array
-        #at the new position of the player
-        nextTile = grid[self.y][self.x]
-        #If the tileType of the tile classifies
-        #as a colidable tile, then the movement is
-        #reversed
-        if self.willCollide(nextTile.x, nextTile.y) or nextTile.tileType in collidable:
-            self.x -= int(direction.x)
-            self.y -= int(direction.y)
+        #If the tileType of the tile at the new
+        #position of the player classifies as a
+        #colidable tile, then the player does
+        #not move
+        if self.willCollide(x, y) or grid.isCollidable(x, y): return
+
+        self.vacate()
+        self.x = x
+        self.y = y
+        self.occupy()
+        onPlayerMoved()
 
     def update(self):
         if self.hitpoints <= 0:
-            print("You have been defeated by an enemy.\nGame over.")
-            os._exit(0)
+            gameOver()
 
         self.doAction()
             
 class Room():
-    def __init__(self, x, y, width, height):
+    def __init__(self, x, y, width, height, door=None):
         self.x = x
         self.y = y
         self.width = width 
         self.height = height
 
-        self.enemies = []
+        #Rooms are numbered in the order they are added to the level
+        self.id = len(rooms)
+        self.enemyCount = 0
         self.borders = []
         self.floors = []
 
-        for row in range(self.height):
-            for col in range(self.width):
-                tile = grid[self.y + row][self.x + col]
-                if tile.tileType == "border":
-                    self.borders.append(tile)
-                elif tile.tileType == "floor":
-                    self.floors.append(tile)
+        for row in range(self.y, self.y + self.height):
+            for col in range(self.x, self.x + self.width):
+                tileType = grid.getType(col, row)
+                if tileType == TileType.BORDER:
+                    self.borders.append(grid.getTile(col, row))
+                elif tileType == TileType.FLOOR:
+                    self.floors.append(grid.getTile(col, row))
 
-        self.door = self.getRandomBorderTile()
+        #Picks a door unless the room is being loaded with its door already decided
+        self.door = door or self.getRandomBorderTile()
         self.active = False
         self.completed = False
 
-    def isRoomOverlapping(self, x, y, width, height):
-        for row in range(height + 2):
-            for col in range(width + 2):
-                xInBounds = self.x - 1 <= x + col <= self.x + self.width + 1
-                yInBounds = self.y - 1 <= y + row <= self.y + self.height + 1
-
-                if xInBounds and yInBounds: return True
-
     def getSpawnTile(self):
         #Calculates coordinates of random tile within the room
-        x = self.x + random.randint(1, self.width - 2)
-        y = self.y + random.randint(1, self.height - 2)
-        while x == player.x and y == player.y:
-            x = self.x + random.randint(1, self.width - 2)
-            y = self.y + random.randint(1, self.height - 2)            
+        x = self.x + levelRandom.randint(1, self.width - 2)
+        y = self.y + levelRandom.randint(1, self.height - 2)
+        #Picks another tile while an entity is already standing there
+        while (x, y) in occupancy:
+            x = self.x + levelRandom.randint(1, self.width - 2)
+            y = self.y + levelRandom.randint(1, self.height - 2)            
         #Gets the tile from the coordinates
-        tile = grid[y][x]
+        tile = grid.getTile(x, y)
         #Returns the tile
         return tile
 
     def completeRoom(self):
+        global incompleteRoomCount
+
         self.active = False
         self.completed = True
+        activeRooms.remove(self)
+        incompleteRoomCount -= 1
         self.door.tileType = "door"
+        patchLayerTile(self.door.x, self.door.y)
+        #The player may be able to see through the door now it is open
+        invalidateFieldOfView()
 
         #Plays complete sound
         playSound("roomComplete")
 
         #Checks if all rooms are completed
         if areAllRoomsCompleted():
-            #Move onto the next level
+            #Move onto the next level once the current update has finished
             newLevel()
             
 
     def activateRoom(self):
         self.active = True
+        activeRooms.append(self)
         self.door.tileType = "lockedDoor"
+        patchLayerTile(self.door.x, self.door.y)
+        invalidateFieldOfView()
         self.spawnEnemies()
 
         #Plays room enter sound
@@ -483,55 +1165,376 @@ class Room():
     def spawnEnemies(self):
         global levelCount
         
-        for i in range(random.randint(1, 2) + levelCount):        
+        #Stores the number of enemies to spawn, leaving at least
+        #one floor tile free for the player
+        enemyCount = min(levelRandom.randint(minExtraEnemies, maxExtraEnemies) + math.ceil(enemiesPerLevel * levelCount), len(self.floors) - 1)
+        for i in range(enemyCount):
             #Gets the spawn tile
             spawnTile = self.getSpawnTile()
             #Creates an enemy object
             enemy = Enemy(spawnTile.x, spawnTile.y, "enemy", self)
-            #Appends it to the entities list
-            entities.append(enemy)
-            #Appends it to the room's enemy list
-            self.enemies.append(enemy)
-
-    def isContainingPlayer(self):
-        xInBounds = self.x + 1 < player.x < self.x + self.width - 2
-        yInBounds = self.y + 1 < player.y < self.y + self.height - 2
-
-        return xInBounds and yInBounds
-
-    #Runs every frame
+            #Enemies hunt the player straight away unless they are waiting to be seen
+            enemy.aware = 0 if enemiesWaitUntilSeen else 1
+            #Counts it as one of the room's enemies
+            self.enemyCount += 1
+            #Stores it in the occupancy map
+            enemy.occupy()
+
+    #Runs every tick while the room is active
     def update(self):
-        #Checks if the room has not been visited and if
-        #the player is inside the room
-        if self.completed == False and self.isContainingPlayer() and self.active == False:
-            #Actives the room (locks the door, spawns enemies)
-            self.activateRoom()
-
-        #Checks if the room is currently active and
-        #that there are no more enemies remaining
-        if self.active == True and len(self.enemies) == 0:
+        #Checks that there are no more enemies remaining
+        if self.enemyCount == 0:
             #Completes the room (unlocks the door)
             self.completeRoom()
 
-        updateElements(self.enemies)
-
     def getRandomBorderTile(self):
-        return random.choice(self.borders)
+        return levelRandom.choice(self.borders)
+
+#The room placer keeps track of the space left within a level, so that
+#rooms can be placed without repeatedly guessing positions
+class RoomPlacer():
+    def __init__(self, columns, rows):
+        self.columns = columns
+        self.rows = rows
+
+        #Stores 1 for every tile taken up by a room or the gap around it
+        self.used = bytearray(columns * rows)
+
+        #Stores the index of every position where the smallest room still fits
+        self.anchors = []
+        #Maps each anchor to its position within the anchors list
+        self.anchorPositions = {}
+        for y in range(2, rows - 1 - minRoomSize):
+            for x in range(2, columns - 1 - minRoomSize):
+                self.anchorPositions[y * columns + x] = len(self.anchors)
+                self.anchors.append(y * columns + x)
+
+    def removeAnchor(self, anchor):
+        position = self.anchorPositions.pop(anchor, None)
+        if position is None: return
+        #Moves the last anchor into the removed anchor's place so nothing is shifted
+        lastAnchor = self.anchors.pop()
+        if lastAnchor != anchor:
+            self.anchors[position] = lastAnchor
+            self.anchorPositions[lastAnchor] = position
+
+    #Checks if a room fits at a position without coming within a tile of another room
+    def doesRoomFit(self, x, y, width, height):
+        if x + width > self.columns - 2 or y + height > self.rows - 2: return False
+        #Searches each row of the room and its gap for a used tile
+        for row in range(y, y + height + 2):
+            start = row * self.columns + x
+            if self.used.find(1, start, start + width + 2) != -1: return False
+        return True
+
+    #Finds a position and size for a new room, or returns None once the level is full
+    def findRoom(self):
+        if not self.anchors: return None
+
+        y, x = divmod(levelRandom.choice(self.anchors), self.columns)
+        width = levelRandom.randint(minRoomSize, maxRoomSize)
+        height = levelRandom.randint(minRoomSize, maxRoomSize)
+        #Shrinks the room until it fits, the smallest room always fits at an anchor
+        while not self.doesRoomFit(x, y, width, height):
+            if width > minRoomSize:
+                width -= 1
+            else:
+                height -= 1
+
+        return width, height, x, y
+
+    def placeRoom(self, x, y, width, height):
+        #Marks the room along with a gap of one tile around it as used
+        usedRow = b"\x01" * (width + 3)
+        for row in range(y - 1, y + height + 2):
+            start = row * self.columns + x - 1
+            self.used[start:start + width + 3] = usedRow
+
+        #Removes every anchor where the smallest room would now overlap
+        for anchorY in range(max(y - minRoomSize - 2, 0), y + height + 2):
+            for anchorX in range(max(x - minRoomSize - 2, 0), x + width + 2):
+                self.removeAnchor(anchorY * self.columns + anchorX)
+
+#The profiler times each phase of a frame, keeping the most recent
+#timings of every phase so their percentiles can be shown or saved
+class Profiler():
+    def __init__(self, windowSize):
+        self.enabled = False
+        self.overlayVisible = False
+        self.windowSize = windowSize
+        #Stores the recent timings of each phase in seconds, in the order the phases first ran
+        self.samples = {}
+        #Stores the lines of text shown on the overlay and the frames until they are next updated
+        self.overlayLines = []
+        self.overlayCountdown = 0
+        #Stores the file the timings are saved to when the game closes
+        self.outputPath = None
+
+    #Calls a function, timing how long it takes if the profiler is enabled
+    def run(self, phase, function, *args):
+        if not self.enabled: return function(*args)
+
+        startTime = time.perf_counter()
+        result = function(*args)
+        self.record(phase, time.perf_counter() - startTime)
+        return result
+
+    def record(self, phase, duration):
+        samples = self.samples.get(phase)
+        if samples is None:
+            samples = deque(maxlen=self.windowSize)
+            self.samples[phase] = samples
+        samples.append(duration)
+
+    #Gets the 50th, 95th and 99th percentile of a phase's timings in milliseconds
+    def getPercentiles(self, phase):
+        ordered = sorted(self.samples[phase])
+        return [ordered[min(len(ordered) - 1, len(ordered) * percent // 100)] * 1000 for percent in (50, 95, 99)]
+
+    #Gets a line of text for each phase showing its percentiles
+    def getReport(self):
+        lines = []
+        for phase in self.samples:
+            p50, p95, p99 = self.getPercentiles(phase)
+            lines.append(phase + ": p50 " + format(p50, ".2f") + " p95 " + format(p95, ".2f") + " p99 " + format(p99, ".2f") + " ms")
+        return lines
+
+    #Shows or hides the overlay, profiling starts when it is first shown
+    def toggleOverlay(self):
+        self.overlayVisible = not self.overlayVisible
+        self.enabled = self.enabled or self.overlayVisible
+        self.overlayCountdown = 0
+        markDirty(profileArea)
+
+    def updateOverlay(self):
+        #The numbers change too often to read, so they are only updated every so often
+        self.overlayCountdown -= 1
+        if self.overlayCountdown <= 0:
+            self.overlayCountdown = profileOverlayInterval
+            self.overlayLines = self.getReport()
+            markDirty(profileArea)
+
+    def drawOverlay(self):
+        if not self.overlayVisible: return
+        for i, line in enumerate(self.overlayLines):
+            #The lines only change every few frames, so they are drawn from the text cache in between
+            image = renderText("small", line, (255, 255, 0))
+            screen.blit(image, (profileArea.x, profileArea.y + i * 18))
+
+    #Saves every timing of each phase, as a CSV file if the path ends in .csv and as JSON otherwise
+    def save(self, path):
+        if path.lower().endswith(".csv"):
+            with open(path, "w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(["phase", "sample", "milliseconds"])
+                for phase, samples in self.samples.items():
+                    for i, duration in enumerate(samples):
+                        writer.writerow([phase, i, duration * 1000])
+            return
+
+        report = {}
+        for phase, samples in self.samples.items():
+            p50, p95, p99 = self.getPercentiles(phase)
+            report[phase] = {"p50" : p50, "p95" : p95, "p99" : p99,
+                             "milliseconds" : [duration * 1000 for duration in samples]}
+        with open(path, "w") as file:
+            json.dump(report, file, indent=2)
+
+    #Saves the timings if a file to save them to was given
+    def finish(self):
+        if self.outputPath:
+            self.save(self.outputPath)
+
+#Stores the profiler which times each phase of a frame
+profiler = Profiler(profileWindow)
+
+#The input recorder stores the directions pressed during every tick of a run and
+#every click along with the run's seed, which is everything needed to play the
+#run again exactly as it happened
+class InputRecorder():
+    def __init__(self, path):
+        self.path = path
+        self.seed = None
+        #Stores whether the run being recorded has ended
+        self.stopped = False
+        #Stores the key mask of every tick, one byte each
+        self.keyMasks = bytearray()
+        #Stores a hash of the game's state after every tick
+        self.stateHashes = array("I")
+        #Stores the tick and mouse position of every click
+        self.clicks = []
+
+    #Only the first run of a session is recorded
+    def startRun(self, seed):
+        if self.seed is None:
+            self.seed = seed
+        else:
+            self.stopped = True
+
+    def recordTick(self, mask):
+        if self.stopped or self.seed is None: return
+        self.keyMasks.append(mask)
+
+    def recordClick(self, position):
+        if self.stopped or self.seed is None: return
+        #Clicks are handled between ticks, so they are stored against the tick which follows
+        self.clicks.append((len(self.keyMasks), position[0], position[1]))
+
+    def recordStateHash(self, stateHash):
+        if self.stopped or self.seed is None: return
+        self.stateHashes.append(stateHash)
+
+    def save(self):
+        if self.seed is None: return
+        data = bytearray(struct.pack(recordingHeaderFormat, self.seed, len(self.keyMasks), len(self.stateHashes), len(self.clicks)))
+        data += self.keyMasks
+        data += self.stateHashes.tobytes()
+        for click in self.clicks:
+            data += struct.pack(clickRecordFormat, *click)
+        #Key masks rarely change from one tick to the next, so the recording compresses well
+        with open(self.path, "wb") as file:
+            file.write(recordingFileMagic + zlib.compress(bytes(data), 9))
+        print("Recorded " + str(len(self.keyMasks)) + " ticks to " + self.path)
+
+#The input replay feeds the input stored by an input recorder back into the game,
+#optionally checking that the game's state matches the recording after every tick
+class InputReplay():
+    def __init__(self, path, verify):
+        with open(path, "rb") as file:
+            data = file.read()
+        if not data.startswith(recordingFileMagic):
+            raise ValueError(path + " is not a recording")
+        data = zlib.decompress(data[len(recordingFileMagic):])
+
+        self.seed, tickCount, hashCount, clickCount = struct.unpack_from(recordingHeaderFormat, data)
+        offset = struct.calcsize(recordingHeaderFormat)
+        self.keyMasks = data[offset:offset + tickCount]
+        offset += tickCount
+        self.stateHashes = array("I")
+        self.stateHashes.frombytes(data[offset:offset + hashCount * 4])
+        offset += hashCount * 4
+
+        #Stores the mouse positions clicked before each tick
+        self.clicks = {}
+        for tick, x, y in struct.iter_unpack(clickRecordFormat, data[offset:offset + clickCount * struct.calcsize(clickRecordFormat)]):
+            self.clicks.setdefault(tick, []).append((x, y))
+
+        self.verify = verify
+        #Stores the next tick to be played and the first tick the game's state did not match the recording on
+        self.tick = 0
+        self.divergedTick = None
+
+    def isFinished(self):
+        return self.tick >= len(self.keyMasks)
+
+    #Clicks the recorded positions and returns the key mask of the next tick
+    def nextTick(self):
+        for position in self.clicks.get(self.tick, []):
+            processClick(scenes[currentScene]["buttons"], position)
+        mask = self.keyMasks[self.tick]
+        self.tick += 1
+        return mask
+
+    #Compares the state of the game to the recording, reporting the first tick they differ on
+    def checkStateHash(self, stateHash):
+        if not self.verify or self.divergedTick is not None: return
+        tick = self.tick - 1
+        if tick < len(self.stateHashes) and self.stateHashes[tick] != stateHash:
+            self.divergedTick = tick
+            print("Replay diverged from the recording on tick " + str(tick))
+
+#Stores the recorder of the current session's input and the replay being played, if there are any
+recorder = None
+replay = None
+
+#The audio manager plays every sound effect on a group of mixer channels reserved for
+#the sound's category, so a flood of combat sounds can never take every channel
+class AudioManager():
+    def __init__(self):
+        #Reserves every channel, so PyGame never picks one of them for a sound by itself
+        channelCount = sum(channelGroupSizes.values())
+        pygame.mixer.set_num_channels(channelCount)
+        pygame.mixer.set_reserved(channelCount)
+
+        #Stores the channels of each category
+        self.channelGroups = {}
+        #Stores the time each channel last started playing, for every category
+        self.startTimes = {}
+        channelId = 0
+        for category, groupSize in channelGroupSizes.items():
+            self.channelGroups[category] = [pygame.mixer.Channel(channelId + i) for i in range(groupSize)]
+            self.startTimes[category] = [0] * groupSize
+            channelId += groupSize
+
+        #Stores the time each sound was last played
+        self.lastPlayed = {}
+
+        #Decodes every sound effect now rather than partway through a fight
+        for soundName in soundNames:
+            sounds[soundName]
+
+    def play(self, soundName):
+        playTime = pygame.time.get_ticks()
+        #Drops the sound if it was only just played, as the two would be heard as one anyway
+        if playTime - self.lastPlayed.get(soundName, -minSoundInterval) < minSoundInterval: return
+        self.lastPlayed[soundName] = playTime
+
+        category = soundCategories[soundName]
+        channels = self.channelGroups[category]
+        startTimes = self.startTimes[category]
+
+        #Plays on a free channel of the category, or cuts off the sound which started the
+        #longest ago when every channel is busy
+        oldest = 0
+        for i, channel in enumerate(channels):
+            if not channel.get_busy():
+                oldest = i
+                break
+            if startTimes[i] < startTimes[oldest]:
+                oldest = i
+
+        channels[oldest].play(sounds[soundName])
+        startTimes[oldest] = playTime
+
+#Stores the audio manager, None in headless mode or when there is no audio device
+audio = None
 
 def playSound(soundName):
-    #If sound is disabled then return the function
-    if not soundEnabled: return 
-    #Accesses a sound object from the sounds dictionary and plays it
-    sounds[soundName].play()
+    #If sound is disabled or there is no audio device then return the function
+    if not soundEnabled or not audio: return
+    #Plays the sound on one of the channels of its category
+    audio.play(soundName)
 
 def areAllRoomsCompleted():
-    #Iterates through each room
+    return incompleteRoomCount == 0
+
+#Records which room every tile is inside of, once all of a level's rooms have been made
+def buildRoomIndex():
+    global roomIndex, incompleteRoomCount, enteredRoom
+
+    roomIndex = array("H", [0]) * (columns * rows)
     for room in rooms:
-        #If a single room is found to be not completed, then return false
-        if room.completed == False:
-            return False
-    #If no rooms left have been not completed, then return true
-    return True
+        #Only the tiles at least one tile away from the room's border count as being inside it
+        rowIds = array("H", [room.id + 1]) * (room.width - 4)
+        for y in range(room.y + 2, room.y + room.height - 2):
+            start = y * columns + room.x + 2
+            roomIndex[start:start + room.width - 4] = rowIds
+
+    activeRooms.clear()
+    incompleteRoomCount = len(rooms)
+    enteredRoom = None
+
+#Gets the room a tile is inside of, or None if it is not inside any room
+def getRoomAt(x, y):
+    roomId = roomIndex[y * columns + x]
+    if not roomId: return None
+    return rooms[roomId - 1]
+
+#Runs whenever the player moves onto a different tile
+def onPlayerMoved():
+    global enteredRoom
+    #Remembers the room the player has walked into, so it is activated when the rooms are next updated
+    enteredRoom = getRoomAt(player.x, player.y)
 
 def getOffset():
     #Calculates the offset relative to the player using the constants, scale and tilewidth.
@@ -540,34 +1543,125 @@ def getOffset():
     #Returns offset calculated 
     return offset
             
-def drawGrid():
-    for row in range(rows):
-        for col in range(columns):
-            tile = grid[row][col]
-            tile.draw()
+#Draws every tile of a chunk of the level onto its own surface
+def renderLayerChunk(chunkX, chunkY):
+    tileSize = tileWidth * scale
+    surface = pygame.Surface((layerChunkSize * tileSize, layerChunkSize * tileSize))
+
+    left = chunkX * layerChunkSize
+    top = chunkY * layerChunkSize
+    atlasSurface = getAtlas().surface
+    tileRects = atlas.tileRects
+    drawList = []
+    for row in range(top, min(top + layerChunkSize, rows)):
+        for col in range(left, min(left + layerChunkSize, columns)):
+            drawList.append((atlasSurface, ((col - left) * tileSize, (row - top) * tileSize),
+                             tileRects[grid.getType(col, row)]))
+    surface.blits(drawList, doreturn=False)
+
+    return surface
+
+#Gets a pre-rendered chunk of the level, rendering it if it is not cached
+def getLayerChunk(chunkX, chunkY):
+    key = (chunkX, chunkY)
+    chunk = layerChunks.get(key)
+    if chunk:
+        #Marks the chunk as the most recently used one
+        layerChunks.move_to_end(key)
+        return chunk
+
+    chunk = renderLayerChunk(chunkX, chunkY)
+    layerChunks[key] = chunk
+    #Discards the least recently used chunk once there are too many
+    if len(layerChunks) > maxLayerChunks:
+        layerChunks.popitem(last=False)
+    return chunk
+
+#Redraws a single tile within the pre-rendered chunks after its type changes
+def patchLayerTile(x, y):
+    chunk = layerChunks.get((x // layerChunkSize, y // layerChunkSize))
+    #Chunks that have not been rendered yet will be drawn correctly later
+    if not chunk: return
+
+    tileSize = tileWidth * scale
+    sprite = getAtlas().tileRects[grid.getType(x, y)]
+    chunk.blit(atlas.surface, ((x % layerChunkSize) * tileSize, (y % layerChunkSize) * tileSize), sprite)
+    markTileDirty(x, y)
+
+#Stores the surfaces drawn over tiles the player cannot see, made once PyGame is initialised
+fogSurfaces = {}
+
+#Adds the visible part of the level to the list of sprites to be drawn
+def drawGrid(drawList):
+    tileSize = tileWidth * scale
+    offset = getOffset()
+
+    #Only the tiles within the player's view radius are drawn
+    left = max(player.x - viewRadius, 0)
+    top = max(player.y - viewRadius, 0)
+    right = min(player.x + viewRadius + 1, columns)
+    bottom = min(player.y + viewRadius + 1, rows)
+
+    #Draws the visible part of every chunk that overlaps the visible area
+    for chunkY in range(top // layerChunkSize, (bottom - 1) // layerChunkSize + 1):
+        for chunkX in range(left // layerChunkSize, (right - 1) // layerChunkSize + 1):
+            chunk = getLayerChunk(chunkX, chunkY)
+            chunkLeft = chunkX * layerChunkSize
+            chunkTop = chunkY * layerChunkSize
+
+            #Stores the visible area clipped to the bounds of the chunk, in tiles
+            x1 = max(left, chunkLeft)
+            y1 = max(top, chunkTop)
+            x2 = min(right, chunkLeft + layerChunkSize)
+            y2 = min(bottom, chunkTop + layerChunkSize)
+
+            area = pygame.Rect((x1 - chunkLeft) * tileSize, (y1 - chunkTop) * tileSize,
+                               (x2 - x1) * tileSize, (y2 - y1) * tileSize)
+            drawList.append((chunk, (x1 * tileSize + offset.x, y1 * tileSize + offset.y), area))
+
+    #Covers the tiles the player cannot see, leaving the tiles they have seen before dimmed
+    for y in range(top, bottom):
+        for x in range(left, right):
+            index = y * columns + x
+            if visibleTiles[index]: continue
+            cover = fogSurfaces["explored"] if exploredTiles[index] else fogSurfaces["unexplored"]
+            drawList.append((cover, (x * tileSize + offset.x, y * tileSize + offset.y)))
+
+#Gets the seed of the current level, which depends only on the run's seed and the level count
+def getLevelSeed():
+    return str(runSeed) + "-" + str(levelCount)
+
+#Removes every entity and effect from the level
+def clearEntities():
+    global entities, occupancy, enemyStore, effects, scheduler
+    entities = []
+    occupancy = {}
+    enemyStore = EnemyStore()
+    scheduler = timerwheel.TimerWheel(currentTick)
+    effects = EffectPool(maxEffects)
 
 def generateLevel():
-    global grid, rooms, entities, levelCount, rows, columns
+    global grid, rooms, levelCount, rows, columns, generationTime
+
+    startTime = time.perf_counter()
+    #The same seed and level count always generate the same level
+    levelRandom.seed(getLevelSeed())
     
-    grid = []
     rooms = []
-    entities = []
+    clearEntities()
+    #Any chunks rendered for the previous level are out of date
+    layerChunks.clear()
 
     #Increase room size as the level count increases
     rows = 28 + 5 * levelCount
     columns = 28 + 5 * levelCount
-    
-    for row in range(rows):
-        grid.append([])
-        for col in range(columns):
-            tile = Tile(col, row, "wall")
-            grid[row].append(tile)
 
-    count = 0
+    #Creates a grid filled with walls
+    grid = Grid(columns, rows, TileType.WALL)
+
+    placer = RoomPlacer(columns, rows)
     while True:
-        if generateRoom() == "stop": break
-        count += 1
-    print(count)
+        if generateRoom(placer) == "stop": break
 
     for i in range(len(rooms)):
         if i == 0: continue
@@ -577,75 +1671,175 @@ def generateLevel():
     for room in rooms:
         #Sets the tiletype of the entry point of each room to "door"
         room.door.tileType = "door"
-        
 
-def isRoomOverlapping(x, y, width, height):
+    buildRoomIndex()
+
+    #Reports how long the level took to generate
+    generationTime = time.perf_counter() - startTime
+    print("Level " + str(levelCount) + ": generated " + str(len(rooms)) + " rooms in " + str(round(generationTime * 1000)) + "ms")
+
+#Converts the current level into bytes so it can be sent between processes
+def serializeLevel():
+    data = bytearray(struct.pack(levelHeaderFormat, columns, rows, len(rooms)))
     for room in rooms:
-        if room.isRoomOverlapping(x, y, width, height): return True
-
-def calculateRoomPositionAndSize():
-    width = random.randint(8, 10)
-    height = random.randint(8, 10)
-    x = random.randint(2, columns - 2 - width)
-    y = random.randint(2, rows - 2 - height)
-
-    return width, height, x, y
-
-def generateRoom():
-    tries = 0
-    width, height, x, y = calculateRoomPositionAndSize()
-    while isRoomOverlapping(x, y, width, height):
-        tries += 1
-        if tries >= 500: return "stop"
-        width, height, x, y = calculateRoomPositionAndSize()
-    
-    for row in range(height):
-        for col in range(width):
-            tile = grid[y + row][x + col]
-            tile.tileType = "border"
+        data += struct.pack(roomRecordFormat, room.x, room.y, room.width, room.height, room.door.x, room.door.y)
+    data += grid.cells
+    return bytes(data)
+
+#Replaces the current level with one that has been serialized
+def loadLevel(data):
+    global grid, rooms, rows, columns
+
+    #Checks the data holds a whole level before anything is replaced, so a
+    #damaged level raises ValueError and leaves the current level untouched
+    headerSize = struct.calcsize(levelHeaderFormat)
+    recordSize = struct.calcsize(roomRecordFormat)
+    if len(data) < headerSize: raise ValueError("Level data is too short")
+    levelColumns, levelRows, roomCount = struct.unpack_from(levelHeaderFormat, data, 0)
+    if len(data) != headerSize + roomCount * recordSize + levelColumns * levelRows:
+        raise ValueError("Level data has the wrong size")
+
+    offset = headerSize
+    roomRecords = []
+    for i in range(roomCount):
+        roomRecords.append(struct.unpack_from(roomRecordFormat, data, offset))
+        offset += recordSize
+
+    columns = levelColumns
+    rows = levelRows
+    clearEntities()
+    #Any chunks rendered for the previous level are out of date
+    layerChunks.clear()
+
+    grid = Grid(columns, rows)
+    grid.cells[:] = data[offset:offset + columns * rows]
 
-    for row in range(height - 2):
-        for col in range(width - 2):
-            tile = grid[y + row + 1][x + col + 1]
-            tile.tileType = "floor"
+    rooms = []
+    for x, y, width, height, doorX, doorY in roomRecords:
+        rooms.append(Room(x, y, width, height, grid.getTile(doorX, doorY)))
+    buildRoomIndex()
+
+#Gets the path of the file the current level is cached within
+def getLevelCachePath():
+    return os.path.join(levelCacheDirectory, str(runSeed) + "-" + str(levelCount) + "-v" + str(levelGeneratorVersion) + ".level")
+
+#Loads the current level from the cache, returning False if it has not been cached
+def loadCachedLevel():
+    if not levelCacheEnabled: return False
+    try:
+        with open(getLevelCachePath(), "rb") as file:
+            #Maps the file into memory rather than reading it all in
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data[:len(levelFileMagic)] != levelFileMagic: return False
+                view = memoryview(data)
+                payload = view[len(levelFileMagic):]
+                #The map cannot be closed while views of it are still held
+                try:
+                    loadLevel(payload)
+                finally:
+                    payload.release()
+                    view.release()
+        return True
+    except Exception:
+        #A damaged or unreadable file is treated as if the level was never cached
+        return False
 
-    grid[y][x].tileType = "wall"
-    grid[y + height - 1][x].tileType = "wall"
-    grid[y][x + width - 1].tileType = "wall"
-    grid[y + height - 1][x + width - 1].tileType = "wall"
+#Saves the current level into the cache
+def saveLevelToCache(data):
+    if not levelCacheEnabled: return
+    try:
+        os.makedirs(levelCacheDirectory, exist_ok=True)
+        path = getLevelCachePath()
+        #Writes to a temporary file first so a half written level is never loaded
+        temporaryPath = path + "." + str(os.getpid()) + ".tmp"
+        with open(temporaryPath, "wb") as file:
+            file.write(levelFileMagic)
+            file.write(data)
+        os.replace(temporaryPath, path)
+
+        #Deletes the oldest levels once there are too many
+        paths = [os.path.join(levelCacheDirectory, name) for name in os.listdir(levelCacheDirectory) if name.endswith(".level")]
+        if len(paths) > maxCachedLevels:
+            paths.sort(key=os.path.getmtime)
+            for oldPath in paths[:len(paths) - maxCachedLevels]:
+                os.remove(oldPath)
+    except OSError:
+        #The game still works without a cache, it is just slower
+        pass
+
+#Generates a level and returns it serialized. This runs within
+#a worker process so it does not touch the game being played
+def generateLevelData(seed, level):
+    global runSeed, levelCount
+    runSeed = seed
+    levelCount = level
+    generateLevel()
+    data = serializeLevel()
+    saveLevelToCache(data)
+    return data
+
+#Starts generating the next level in the background while this one is played
+def pregenerateNextLevel():
+    global levelPool, pendingLevel
+
+    #Headless runs have no frame rate to protect, so levels are generated when needed
+    if headless: return
+
+    if levelPool is None:
+        #Worker processes are spawned fresh rather than forked from the running game
+        context = multiprocessing.get_context("spawn")
+        levelPool = concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context)
+    try:
+        pendingLevel = (runSeed, levelCount + 1, levelPool.submit(generateLevelData, runSeed, levelCount + 1))
+    except concurrent.futures.BrokenExecutor:
+        #Levels are generated when needed instead if the worker process has died
+        pendingLevel = None
+
+#Returns the current level if it has finished generating in the background
+def takePregeneratedLevel():
+    global pendingLevel
+
+    if not pendingLevel: return None
+    seed, level, future = pendingLevel
+    pendingLevel = None
+
+    #The level is generated on the spot instead if it is not ready
+    if seed != runSeed or level != levelCount or not future.done():
+        future.cancel()
+        return None
+    if future.exception(): return None
+    return future.result()
+
+#Stops the background level generation
+def stopLevelPool():
+    if levelPool:
+        levelPool.shutdown(wait=False, cancel_futures=True)
+
+def generateRoom(placer):
+    #Stops once there is no space left for another room
+    position = placer.findRoom()
+    if not position: return "stop"
+    width, height, x, y = position
+    placer.placeRoom(x, y, width, height)
+    
+    grid.fill(x, y, width, height, TileType.BORDER)
+    grid.fill(x + 1, y + 1, width - 2, height - 2, TileType.FLOOR)
+
+    grid.setType(x, y, TileType.WALL)
+    grid.setType(x, y + height - 1, TileType.WALL)
+    grid.setType(x + width - 1, y, TileType.WALL)
+    grid.setType(x + width - 1, y + height - 1, TileType.WALL)
 
     room = Room(x, y, width, height)
     rooms.append(room)
 
-def getDistanceFromTiles(tile1, tile2):
-    tile1Pos = pygame.Vector2(tile1.x, tile1.y)
-    tile2Pos = pygame.Vector2(tile2.x, tile2.y)
-    distance = tile1Pos.distance_to(tile2Pos)
-    return distance
-
+#Finds the cheapest path between two tiles, returning the path as
+#a dictionary of tile indices within the grid along with the index
+#of the tile the path ends on
 def aStar(startTile, goalTile):
-    frontier = queue.PriorityQueue()
-    frontier.put(PrioritizedItem(0, startTile))
-    
-    cameFrom = dict()
-    costSoFar = dict()
-    cameFrom[startTile] = None
-    costSoFar[startTile] = 0
-
-    while not frontier.empty():   
-        currentTile = frontier.get().item
-
-        for nextTile in currentTile.getNeighbours():
-            if nextTile == goalTile: return cameFrom, currentTile
-            
-            newCost = costSoFar[currentTile] + nextTile.getCost()
-            
-            if nextTile not in costSoFar or newCost < costSoFar[nextTile]:
-                costSoFar[nextTile] = newCost
-                cameFrom[nextTile] = currentTile
-                
-                priority = newCost + getDistanceFromTiles(nextTile, goalTile) 
-                frontier.put(PrioritizedItem(priority, nextTile))
+    start = grid.index(startTile.x, startTile.y)
+    goal = grid.index(goalTile.x, goalTile.y)
+    return pathfinding.aStar(grid.cells, columns, rows, start, goal, costTable)
 
 def generateCorridor(room1, room2):
     #Calculates path from room1's door to room2's door
@@ -653,7 +1847,7 @@ def generateCorridor(room1, room2):
     #Backtracks the dictionary returned
     while currentTile in cameFrom:
         #Turns each tile within the dictionary into a floor
-        currentTile.tileType = "floor"
+        grid.cells[currentTile] = TileType.FLOOR
         currentTile = cameFrom[currentTile]
     #The tile type of the entry point for both rooms are set to "floor"
     room1.door.tileType = "floor"
@@ -661,32 +1855,71 @@ def generateCorridor(room1, room2):
 
 #Function to get the first non-collidable tile
 def getNextEmptyTile():
-    #Iterates through the 2D array
-    for row in range(rows):
-        for col in range(columns):
-            #Gets the tile at a position
-            tile = grid[row][col]
-            #Checks if the tile is not collidable, if it
-            #isn't then return the tile whereas if it
-            #is collidable then check the next tile
-            if tile.tileType not in collidable:
-                return tile
+    return grid.findFirstEmpty()
 
 #Procedure which calls the draw method of every entity
-def drawEntities():
+def drawEntities(drawList):
     #Loops through all entities
     for entity in entities:
         #Calls each entity's draw method
-        entity.draw()
+        entity.draw(drawList)
+    #Enemies are kept separately within the enemy store
+    for enemy in enemyStore.enemies:
+        enemy.draw(drawList)
+
+#Renders text, reusing the surface rendered previously for the same
+#font, text and colour if there is one
+def renderText(fontName, text, colour):
+    key = (fontName, text, colour)
+    image = textCache.get(key)
+    if image:
+        #Marks the text as the most recently used
+        textCache.move_to_end(key)
+        return image
+
+    image = fonts[fontName].render(text, True, colour)
+    textCache[key] = image
+    #Discards the least recently used text once there are too many
+    if len(textCache) > maxCachedTexts:
+        textCache.popitem(last=False)
+    return image
+
+#Marks an area of the screen as needing to be updated
+def markDirty(rect):
+    global fullRedraw
+
+    #Once too many areas have changed it is simpler to redraw the whole screen
+    if fullRedraw or len(dirtyRects) >= maxDirtyRects:
+        fullRedraw = True
+        dirtyRects.clear()
+        return
+    dirtyRects.append(pygame.Rect(rect))
+
+#Marks the area of the screen which a tile is drawn at as needing to be updated
+def markTileDirty(x, y):
+    if not player: return
+    tileSize = tileWidth * scale
+    offset = getOffset()
+    markDirty((x * tileSize + offset.x, y * tileSize + offset.y, tileSize, tileSize))
+
+#Makes the next draw redraw the whole screen
+def redrawScreen():
+    global fullRedraw
+    fullRedraw = True
+
+#Updates only the areas of the screen which have changed
+def updateDisplay():
+    pygame.display.update(dirtyRects)
+    dirtyRects.clear()
 
 def drawHUD():
     #Stores the rendered level font within a variable
-    image = fonts["large"].render("Level " + str(levelCount), True, (255, 255, 255))
+    image = renderText("large", "Level " + str(levelCount), (255, 255, 255))
     #Draws the text to the screen
     screen.blit(image, (30, 30))
 
     #Draws score count onto the screen
-    image = fonts["large"].render("Score: " + str(score), True, (255, 255, 255))
+    image = renderText("large", "Score: " + str(score), (255, 255, 255))
     screen.blit(image, (300, 30))
 
     #Stores the background bar's width
@@ -701,7 +1934,7 @@ def drawHUD():
 
     #Draws text displaying hitpoints in numerical form
     hitpointsText = str(player.hitpoints) + "/" + str(player.maxHitpoints) + "hp"
-    image = fonts["medium"].render(hitpointsText, True, (255, 255, 255))
+    image = renderText("medium", hitpointsText, (255, 255, 255))
     screen.blit(image, (180, 40))
 
 def drawButton(buttonName):
@@ -712,38 +1945,81 @@ def drawButton(buttonName):
     pygame.draw.rect(screen, (100, 100, 100), (button["position"], button["size"]))
 
     #Draws the text of the button using its text value stored in thedictionary
-    image = fonts["medium"].render(button["text"], True, (255, 255, 255))
+    image = renderText("medium", button["text"], (255, 255, 255))
     screen.blit(image, (button["position"] + pygame.math.Vector2(10, 13)))
 
-def drawEffects():
-    for effect in effects:
-        effect.draw()
+def drawEffects(drawList):
+    effects.draw(drawList)
 
 #Draws all the necessary components within the game
 def drawGame():
+    global fullRedraw, cameraPosition, hudState
+
+    #Makes sure the field of view is up to date before anything is drawn from it
+    updateFieldOfView()
+
+    #The camera follows the player, so every tile moves when the player does
+    if (player.x, player.y) != cameraPosition:
+        cameraPosition = (player.x, player.y)
+        fullRedraw = True
+
+    #Redraws the HUD only when the values shown on it change
+    newHUDState = (levelCount, score, player.hitpoints, player.maxHitpoints)
+    if newHUDState != hudState:
+        hudState = newHUDState
+        markDirty(hudArea)
+
+    #Effects are animated so they change every frame
+    effects.markTilesDirty()
+    #The profiler's overlay also has to be redrawn whenever its numbers change
+    if profiler.overlayVisible:
+        profiler.updateOverlay()
+
+    if fullRedraw:
+        fullRedraw = False
+        dirtyRects.clear()
+        dirtyRects.append(screen.get_rect())
+
+    #Nothing needs to be drawn if nothing has changed
+    if not dirtyRects: return
+
+    #Limits drawing to the area that has changed
+    screen.set_clip(dirtyRects[0].unionall(dirtyRects))
     #Fills the screen with black 
     screen.fill((0, 0, 0))
+    #Collects every sprite so they can all be drawn with a single call
+    drawList = []
     #Draws the 2D array grid in a graphically representable form
-    drawGrid()
+    profiler.run("drawGrid", drawGrid, drawList)
     #Draws entities on-top of the grid
-    drawEntities()
+    profiler.run("drawEntities", drawEntities, drawList)
     #Draws effects on-top of entities
-    drawEffects()
+    profiler.run("drawEffects", drawEffects, drawList)
+    profiler.run("blits", screen.blits, drawList, False)
     #Draws the HUD on-top of everything
-    drawHUD()
+    profiler.run("drawHUD", drawHUD)
     #Draws buttons within the game
     for buttonName in gameButtons:
         drawButton(buttonName)
+    #Draws the profiler's timings on-top of everything else
+    profiler.drawOverlay()
+    screen.set_clip(None)
     
-    #Updates the screen with everything that has just been drawn
-    pygame.display.update()
+    #Updates the areas of the screen that have changed
+    profiler.run("display.update", updateDisplay)
 
 #Draws all the necessary components within the main menu
 def drawMainMenu():
+    global fullRedraw
+
+    #The main menu never changes once it has been drawn
+    if not fullRedraw: return
+    fullRedraw = False
+
     #Fills the screen with black 
     screen.fill((0, 0, 0))
     #Draws the title of the game
-    image = fonts["large"].render("Dungeon crawler", True, (255, 255, 255))
+    image = renderText("large", "Dungeon crawler", (255, 255, 255))
     screen.blit(image, (30, 40))
 
     #Draws buttons within the main menu
@@ -755,10 +2031,16 @@ def drawMainMenu():
 
 #Draws all the necessary components within the settings menu
 def drawSettings():
+    global fullRedraw
+
+    #The settings menu never changes once it has been drawn
+    if not fullRedraw: return
+    fullRedraw = False
+
     #Fills the screen with black 
     screen.fill((0, 0, 0))
     #Draws the title of settings menu
-    image = fonts["large"].render("Settings", True, (255, 255, 255))
+    image = renderText("large", "Settings", (255, 255, 255))
     screen.blit(image, (30, 40))
 
     #Draws buttons within the main menu
@@ -768,14 +2050,81 @@ def drawSettings():
     #Updates the screen with everything that has just been drawn
     pygame.display.update()
 
-def updateElements(elements):
-    for element in elements:
-        element.update()
+#Activates the room the player walked into, then updates every active room
+def updateRooms():
+    global enteredRoom
+
+    room = enteredRoom
+    enteredRoom = None
+    if room and not room.completed and not room.active:
+        #Actives the room (locks the door, spawns enemies)
+        room.activateRoom()
+
+    #Rooms can be completed while they are updated, which removes them from the active rooms
+    for room in tuple(activeRooms):
+        room.update()
+
+#Gets a key mask holding the direction the player is moving in
+def getDirectionMask(direction):
+    for directionName in directions:
+        if direction == directions[directionName]:
+            return directionBits[directionName]
+    return 0
+
+#Gets a key mask of the direction keys being held down
+def getPressedKeyMask():
+    keys = pygame.key.get_pressed()
+    mask = 0
+    for directionName in directionKeys:
+        if keys[directionKeys[directionName]]:
+            mask |= directionBits[directionName]
+    return mask
+
+#Decides the input for the coming tick, which comes from the replay being played,
+#a script or bot controlling the player, or the keyboard
+def readInput():
+    global keyMask
+
+    if replay and not replay.isFinished():
+        keyMask = replay.nextTick()
+    elif directionProvider:
+        keyMask = getDirectionMask(directionProvider(player))
+    else:
+        keyMask = getPressedKeyMask()
+
+    if recorder:
+        recorder.recordTick(keyMask)
+
+#Gets a hash of the player, every enemy and the score, which two runs
+#only share if they have played out the same way
+def getStateHash():
+    stateHash = zlib.crc32(struct.pack("<iiiii", player.x, player.y, player.hitpoints, score, levelCount))
+    for column in (enemyStore.x, enemyStore.y, enemyStore.hitpoints):
+        stateHash = zlib.crc32(column, stateHash)
+    return stateHash
 
 def update():
-    updateElements(rooms)
-    updateElements(effects)
-    player.update()
+    global levelCompleted, currentTick
+
+    currentTick += 1
+    readInput()
+
+    profiler.run("rooms", updateRooms)
+    profiler.run("enemies", enemyStore.update)
+    profiler.run("effects", effects.update)
+    profiler.run("player", player.update)
+    profiler.run("fieldOfView", updateFieldOfView)
+
+    #The next level is started between updates so the rooms being updated are never replaced partway through
+    if levelCompleted:
+        levelCompleted = False
+        startLevel()
+        redrawScreen()
+
+    if recorder:
+        recorder.recordStateHash(getStateHash())
+    if replay:
+        replay.checkStateHash(getStateHash())
 
 def spawnPlayer():
     global player
@@ -786,8 +2135,23 @@ def spawnPlayer():
     player = Player(spawnTile.x, spawnTile.y, "player")
     #Appends the player object into the entities list
     entities.append(player)
+    #Stores the player in the occupancy map
+    player.occupy()
+    onPlayerMoved()
 
 def exitGame():
+    profiler.finish()
+    if recorder: recorder.save()
+    stopLevelPool()
+    os._exit(0)
+
+def gameOver():
+    #A headless run carries on with a new game instead of quitting
+    if headless: raise GameOver()
+    print("You have been defeated by an enemy.\nGame over.")
+    profiler.finish()
+    if recorder: recorder.save()
+    stopLevelPool()
     os._exit(0)
 
 def toggleMusic():
@@ -808,9 +2172,12 @@ def toggleSound():
     #Inverts the soundEnabled boolean
     soundEnabled = not soundEnabled
 
-def processClick(buttonType):
-    #Gets mouse position
-    position = pygame.mouse.get_pos()
+def processClick(buttonType, position=None):
+    #Gets mouse position, unless the click is being replayed
+    if not position:
+        position = pygame.mouse.get_pos()
+    if recorder:
+        recorder.recordClick(position)
     #Cycles through all buttons
     for buttonName in buttons:
         #Checks if the button is of a particular type (such as main menu or game)
@@ -830,64 +2197,147 @@ def processClick(buttonType):
             #Returns the function as the button has been clicked
             return
 
-def startGameFromMenu():
-    global levelCount, score
+#Starts a new run from the first level, using a random seed if none is given
+def startRun(seed=None):
+    global runSeed, levelCount, score, levelCompleted, damageTaken, currentTick
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    runSeed = seed
     levelCount = 1
     score = 0
-    game()
+    currentTick = 0
+    damageTaken = 0
+    levelCompleted = False
+    print("Seed: " + str(runSeed))
+    if recorder:
+        recorder.startRun(runSeed)
+
+def startGameFromMenu():
+    startRun(startSeed)
+    changeScene("game")
+
+def openMainMenu():
+    changeScene("mainMenu")
+
+def openSettings():
+    changeScene("settings")
 
 def newLevel():
-    global levelCount
+    global levelCount, levelCompleted
     #Increments level by 1
     levelCount += 1
-    #Restarts game
-    game()
-
-def game():
-    global run
-
-    generateLevel()
+    #The level is rebuilt at the end of the current update
+    levelCompleted = True
+
+def startLevel():
+    #Uses the level generated in the background if it is ready,
+    #then the cached copy of the level if there is one
+    data = takePregeneratedLevel()
+    if data:
+        loadLevel(data)
+    elif not loadCachedLevel():
+        generateLevel()
+        saveLevelToCache(serializeLevel())
+    #Enemy spawns are seeded from the level too, so they do not depend
+    #on whether the level was generated or loaded
+    levelRandom.seed(getLevelSeed() + "-spawns")
+    resetFieldOfView()
     spawnPlayer()
-    
-    while run:
-        clock.tick(60)
-        
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
-            elif event.type == pygame.MOUSEBUTTONUP:
-                processClick(gameButtons)
-
-        update()
-        drawGame()
-
-def mainMenu():
+    pregenerateNextLevel()
+
+#Switches to another scene, which is drawn from the next frame onwards
+def changeScene(sceneName):
+    global currentScene
+
+    currentScene = sceneName
+    redrawScreen()
+    #Runs anything the scene needs to do when it is switched to
+    scene = scenes[sceneName]
+    if scene["onEnter"]:
+        scene["onEnter"]()
+
+#Gets how much faster than normal the game should currently run
+def getTimeScale():
+    #Holding F fast forwards the game
+    if pygame.key.get_pressed()[pygame.K_f]:
+        return timeScale * fastForwardScale
+    return timeScale
+
+#Runs whichever scene is current until the game is closed. The game is updated a fixed
+#number of times every second however often frames are drawn, so timers which count
+#updates take the same amount of time whatever the frame rate is
+def mainLoop():
     global run
-    
-    while run:
-        clock.tick(60)
-        
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
-            elif event.type == pygame.MOUSEBUTTONUP:
-                processClick(mainMenuButtons)
 
-        drawMainMenu()
-
-def settings():
-    global run
+    #Stores the time which has passed that the game has not been updated for yet
+    accumulator = 0
+    previousTime = time.perf_counter()
 
     while run:
-        clock.tick(60)
+        clock.tick(maxFrameRate)
 
+        sceneName = currentScene
+        eventsStartTime = time.perf_counter()
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 run = False
             elif event.type == pygame.MOUSEBUTTONUP:
-                processClick(settingsButtons)
+                processClick(scenes[currentScene]["buttons"])
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                profiler.toggleOverlay()
+            elif event.type == pygame.VIDEOEXPOSE:
+                redrawScreen()
+        if profiler.enabled:
+            profiler.record("events", time.perf_counter() - eventsStartTime)
+
+        currentTime = time.perf_counter()
+        #Time spent switching scenes, such as generating a level, is not caught up on
+        if currentScene != sceneName:
+            accumulator = 0
+        else:
+            accumulator += (currentTime - previousTime) * getTimeScale()
+        previousTime = currentTime
+
+        scene = scenes[currentScene]
+        if scene["update"]:
+            ticks = 0
+            while accumulator >= tickDuration and ticks < maxTicksPerFrame:
+                scene["update"]()
+                accumulator -= tickDuration
+                ticks += 1
+            #Drops any time the game could not catch up on
+            if ticks == maxTicksPerFrame:
+                accumulator = min(accumulator, tickDuration)
+        else:
+            accumulator = 0
+
+        scene["draw"]()
+
+#Stores every scene, with the buttons shown within it and
+#the functions which are called while it is current
+scenes = {
+    "mainMenu" : {
+        "buttons" : mainMenuButtons,
+        "onEnter" : None,
+        "update" : None,
+        "draw" : drawMainMenu
+    },
+    "settings" : {
+        "buttons" : settingsButtons,
+        "onEnter" : None,
+        "update" : None,
+        "draw" : drawSettings
+    },
+    "game" : {
+        "buttons" : gameButtons,
+        "onEnter" : startLevel,
+        "update" : update,
+        "draw" : drawGame
+    }
+}
 
-        drawSettings()
+#Stores the name of the scene being shown
+currentScene = "mainMenu"
 
 #Stores all buttons
 buttons = {
@@ -901,7 +2351,7 @@ buttons = {
         "text": "Settings",
         "position" : pygame.math.Vector2(30, 170),
         "size" : pygame.math.Vector2(150, 40),
-        "onClick" : settings
+        "onClick" : openSettings
     },
     "exit" : {
         "text": "Exit",
@@ -913,7 +2363,7 @@ buttons = {
         "text": "Home",
         "position" : pygame.math.Vector2(485, 525),
         "size" : pygame.math.Vector2(100, 40),
-        "onClick" : mainMenu
+        "onClick" : openMainMenu
     },
     "toggleMusic" : {
         "text": "Toggle music",
@@ -928,9 +2378,180 @@ buttons = {
         "onClick" : toggleSound
     }
 }
-    
+
+#Picks a random direction every tick, used to soak test the game with noisy input
+def getRandomDirection(player):
+    return random.choice(list(directions.values()))
+
+#Checks if a tile is inside a room that the player has not completed yet
+def isInIncompleteRoom(x, y):
+    room = getRoomAt(x, y)
+    return room is not None and not room.completed
+
+#Walks the player towards the closest enemy, or towards the closest
+#room that has not been completed when there are no enemies left
+def getBotDirection(player):
+    #Only plans a step when the player is able to act on the coming tick
+    if currentTick < player.moveReadyTick and currentTick < player.attackReadyTick: return None
+
+    enemyPositions = set(zip(enemyStore.x, enemyStore.y))
+
+    #Breadth first search from the player's position
+    start = (player.x, player.y)
+    cameFrom = {start: None}
+    frontier = [start]
+    goal = None
+    while frontier and not goal:
+        nextFrontier = []
+        for position in frontier:
+            for direction in directions.values():
+                x = position[0] + int(direction.x)
+                y = position[1] + int(direction.y)
+                if (x, y) in cameFrom: continue
+                if not (0 <= x < columns and 0 <= y < rows): continue
+
+                if enemyPositions:
+                    isGoal = (x, y) in enemyPositions
+                else:
+                    isGoal = isInIncompleteRoom(x, y)
+
+                #Enemies are goals but block the path, as do collidable tiles
+                if not isGoal and grid.isCollidable(x, y): continue
+
+                cameFrom[(x, y)] = position
+                if isGoal:
+                    goal = (x, y)
+                    break
+                nextFrontier.append((x, y))
+            if goal: break
+        frontier = nextFrontier
+
+    #Wanders randomly if there is nowhere left to go
+    if not goal: return getRandomDirection(player)
+
+    #Backtracks to find the first step of the path
+    while cameFrom[goal] != start:
+        goal = cameFrom[goal]
+    return pygame.math.Vector2(goal[0] - player.x, goal[1] - player.y)
+
+#Runs the game without a window or a frame cap for a number of ticks,
+#then reports how many ticks were simulated every second
+def runHeadless(ticks, inputMode, seed=None):
+    global directionProvider
+
+    #Selects where the player's input comes from
+    if inputMode == "bot":
+        directionProvider = getBotDirection
+    else:
+        directionProvider = getRandomDirection
+
+    startRun(seed)
+    startLevel()
+
+    deaths = 0
+    highestLevel = levelCount
+    startTime = time.perf_counter()
+    for tick in range(ticks):
+        try:
+            update()
+        except GameOver:
+            #Starts a new game with the next seed once the player dies
+            deaths += 1
+            startRun(runSeed + 1)
+            startLevel()
+        highestLevel = max(highestLevel, levelCount)
+    elapsed = time.perf_counter() - startTime
+
+    print("Simulated " + str(ticks) + " ticks in " + str(round(elapsed, 3)) + "s")
+    print("Ticks per second: " + str(round(ticks / max(elapsed, 1e-9))))
+    print("Highest level: " + str(highestLevel) + ", deaths: " + str(deaths) + ", score: " + str(score))
+    #Prints how long each phase of an update took
+    for line in profiler.getReport():
+        print(line)
+
+#Plays a recorded run without a window or a frame cap, then reports how many ticks were
+#simulated every second. Returns False if the run did not play out as it was recorded
+def runReplay(path, verify):
+    global replay
+
+    replay = InputReplay(path, verify)
+    startRun(replay.seed)
+    startLevel()
+
+    startTime = time.perf_counter()
+    try:
+        while not replay.isFinished():
+            update()
+    except GameOver:
+        pass
+    elapsed = time.perf_counter() - startTime
+
+    print("Replayed " + str(replay.tick) + " ticks in " + str(round(elapsed, 3)) + "s")
+    print("Ticks per second: " + str(round(replay.tick / max(elapsed, 1e-9))))
+    print("Level: " + str(levelCount) + ", score: " + str(score))
+    for line in profiler.getReport():
+        print(line)
+
+    if verify and replay.divergedTick is None:
+        print("The replay matched the recording on every tick")
+    return replay.divergedTick is None
+
+#Reads a seed given on the command line, which has to fit within the
+#unsigned 64 bit number it is stored as within recordings
+def parseSeed(text):
+    seed = int(text)
+    if not 0 <= seed < 2 ** 64:
+        raise argparse.ArgumentTypeError("seed must be between 0 and " + str(2 ** 64 - 1))
+    return seed
+
 run = True
+#Seed used when starting a game from the menu, None picks a random seed
+startSeed = None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="A simple dungeon crawler with procedurally generated maps and endless floors.")
+    parser.add_argument("--headless", action="store_true", help="run the simulation without a window, sound or frame cap")
+    parser.add_argument("--ticks", type=int, default=10000, help="number of ticks to simulate in headless mode")
+    parser.add_argument("--input", choices=["bot", "random"], default="bot", help="what controls the player in headless mode")
+    parser.add_argument("--seed", type=parseSeed, help="seed which decides the layout of every level")
+    parser.add_argument("--no-level-cache", action="store_true", help="always generate levels instead of loading them from the level cache")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="how much faster than normal the game runs, hold F to fast forward further")
+    parser.add_argument("--profile", action="store_true", help="time each phase of every frame, press F3 to show the timings")
+    parser.add_argument("--profile-out", help="file the timings are saved to on exit, as CSV if it ends in .csv and as JSON otherwise")
+    parser.add_argument("--record", help="file the input of the first run played is recorded to")
+    parser.add_argument("--replay", help="recording of a run to play back instead of reading the keyboard")
+    parser.add_argument("--verify", action="store_true", help="check the replay plays out exactly as it was recorded")
+    args = parser.parse_args()
+
+    startSeed = args.seed
+    timeScale = args.time_scale
+    profiler.enabled = args.profile or args.profile_out is not None
+    profiler.outputPath = args.profile_out
+    levelCacheEnabled = not args.no_level_cache
+    if args.record:
+        recorder = InputRecorder(args.record)
+
+    initPygame(args.headless)
+
+    replayMatched = True
+    if args.replay and args.headless:
+        replayMatched = runReplay(args.replay, args.verify)
+    elif args.headless:
+        runHeadless(args.ticks, args.input, args.seed)
+    elif args.replay:
+        #Plays the recording in the window, the keyboard takes over once it has finished
+        replay = InputReplay(args.replay, args.verify)
+        startRun(replay.seed)
+        changeScene("game")
+        mainLoop()
+    else:
+        mainLoop()
 
-mainMenu()
+    profiler.finish()
+    if recorder: recorder.save()
     
-pygame.quit()
+    stopLevelPool()
+    pygame.quit()
+    #Exits with an error if the replay did not match its recording
+    if not replayMatched:
+        raise SystemExit(1)
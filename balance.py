@@ -0,0 +1,156 @@
+import argparse, contextlib, importlib, io, multiprocessing, os, statistics, struct, sys
+import concurrent.futures
+from array import array
+
+#Selects SDL's dummy drivers before PyGame is initialised, so games can be played
+#without a display or sound card
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+os.environ["SDL_AUDIODRIVER"] = "dummy"
+#Keeps PyGame's greeting out of the console, as every worker process would print it
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+
+#The game's file name has a space in it, so it has to be imported by name
+game = importlib.import_module("Dungeon Crawler")
+
+#Stores the names of the values which decide the game's balance, which can be changed with --set
+balanceSettings = ["playerHitpoints", "enemyBaseHitpoints", "enemyHitpointsPerLevel", "enemyPowerPerLevel",
+                   "minExtraEnemies", "maxExtraEnemies", "enemiesPerLevel", "enemiesWaitUntilSeen"]
+
+#Stores the name and array type code of every column of the results, in the order they are stored
+resultColumns = [
+    ("seed", "Q"),
+    ("deathLevel", "H"),
+    ("score", "I"),
+    ("ticks", "I"),
+    ("damageTaken", "I"),
+    ("died", "B")
+]
+
+#Marks the start of a results file, followed by the version of the format
+resultsFileMagic = b"DCBR\x01"
+#Stores the number of runs within a block of results, the runs of each block are stored column by column
+blockHeaderFormat = "<I"
+#Number of runs gathered before they are written to the results file as a block
+blockSize = 256
+
+#Sets up a worker process, which plays many games one after the other
+def initWorker(settings):
+    game.initPygame(True)
+    #Every level must be generated from its seed rather than loaded from the cache
+    game.levelCacheEnabled = False
+    game.directionProvider = game.getBotDirection
+    for name, value in settings.items():
+        setattr(game, name, value)
+
+#Plays a game with the bot until the player dies or the tick limit is reached
+def playGame(seed, maxTicks):
+    #The game prints the seed and every level it generates
+    with contextlib.redirect_stdout(io.StringIO()):
+        game.startRun(seed)
+        game.startLevel()
+
+        died = 0
+        ticks = 0
+        try:
+            while ticks < maxTicks:
+                game.update()
+                ticks += 1
+        except game.GameOver:
+            died = 1
+
+    return (seed, game.levelCount, game.score, ticks, game.damageTaken, died)
+
+#Writes a block of runs to the results file, one column after another
+def writeBlock(file, runs):
+    file.write(struct.pack(blockHeaderFormat, len(runs)))
+    for i, (name, typeCode) in enumerate(resultColumns):
+        file.write(array(typeCode, [run[i] for run in runs]).tobytes())
+    file.flush()
+
+#Reads a results file, returning an array of every column's values keyed by the column's name
+def readResults(path):
+    columns = {name : array(typeCode) for name, typeCode in resultColumns}
+    with open(path, "rb") as file:
+        if file.read(len(resultsFileMagic)) != resultsFileMagic:
+            raise ValueError(path + " is not a results file")
+        while True:
+            header = file.read(struct.calcsize(blockHeaderFormat))
+            #Stops at the end of the file, or at a block which was only partly written
+            if len(header) < struct.calcsize(blockHeaderFormat): break
+            runCount = struct.unpack(blockHeaderFormat, header)[0]
+            for name, typeCode in resultColumns:
+                column = array(typeCode)
+                column.frombytes(file.read(runCount * column.itemsize))
+                columns[name].extend(column)
+    return columns
+
+#Prints averages of the results and the number of runs which ended on each level
+def printSummary(columns):
+    runCount = len(columns["seed"])
+    if not runCount:
+        print("No runs")
+        return
+
+    print("Runs: " + str(runCount) + ", deaths: " + str(sum(columns["died"])))
+    for name in ["deathLevel", "score", "ticks", "damageTaken"]:
+        values = columns[name]
+        print(name + ": mean " + format(statistics.mean(values), ".1f") + ", median " + format(statistics.median(values), ".1f")
+              + ", max " + str(max(values)))
+
+    print("Runs ending on each level:")
+    levelCounts = {}
+    for level in columns["deathLevel"]:
+        levelCounts[level] = levelCounts.get(level, 0) + 1
+    for level in sorted(levelCounts):
+        print("  " + str(level) + ": " + str(levelCounts[level]))
+
+#Reads a NAME=VALUE override of one of the balance settings
+def parseSetting(text):
+    name, separator, value = text.partition("=")
+    if not separator or name not in balanceSettings:
+        raise argparse.ArgumentTypeError("expected NAME=VALUE where NAME is one of " + ", ".join(balanceSettings))
+    try:
+        return name, int(value)
+    except ValueError:
+        return name, float(value)
+
+def main():
+    parser = argparse.ArgumentParser(description="Plays many headless games with the bot to measure the game's balance.")
+    parser.add_argument("--runs", type=int, default=1000, help="number of games to play")
+    parser.add_argument("--first-seed", type=game.parseSeed, default=0, help="seed of the first game, each game after uses the next seed")
+    parser.add_argument("--max-ticks", type=int, default=20000, help="ticks a game is played for before it is stopped")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of processes games are played in")
+    parser.add_argument("--set", type=parseSetting, action="append", default=[], metavar="NAME=VALUE",
+                        help="changes one of the balance settings, can be given more than once")
+    parser.add_argument("--output", default="balance.dcbr", help="file the results of every game are written to")
+    parser.add_argument("--summary", metavar="PATH", help="prints a summary of an existing results file instead of playing games")
+    args = parser.parse_args()
+
+    if args.summary:
+        printSummary(readResults(args.summary))
+        return
+
+    settings = dict(args.set)
+    seeds = range(args.first_seed, args.first_seed + args.runs)
+    #Stores the runs which have not been written to the results file yet
+    block = []
+    with open(args.output, "wb") as file:
+        file.write(resultsFileMagic)
+        context = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(args.workers, mp_context=context, initializer=initWorker, initargs=(settings,)) as executor:
+            #Results are written as they come in, so a long run can be read before it finishes
+            futures = [executor.submit(playGame, seed, args.max_ticks) for seed in seeds]
+            for i, future in enumerate(concurrent.futures.as_completed(futures)):
+                block.append(future.result())
+                if len(block) == blockSize:
+                    writeBlock(file, block)
+                    block = []
+                print("\rPlayed " + str(i + 1) + "/" + str(args.runs) + " games", end="", file=sys.stderr)
+        print(file=sys.stderr)
+        if block:
+            writeBlock(file, block)
+
+    printSummary(readResults(args.output))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import argparse, contextlib, importlib, io, json, os, platform, random, statistics, sys, time
+
+#Selects SDL's dummy drivers before PyGame is initialised, so the benchmarks
+#can run without a display or sound card
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+os.environ["SDL_AUDIODRIVER"] = "dummy"
+#Keeps PyGame's greeting out of the results printed to the console
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+
+import pygame
+import pathfinding
+
+#The game's file name has a space in it, so it has to be imported by name
+game = importlib.import_module("Dungeon Crawler")
+
+#Seed every benchmark is run with, so each run measures exactly the same work
+benchmarkSeed = 1234
+
+#Stores the width and height of each synthetic grid searched by aStar
+aStarSizes = [50, 100, 200, 400]
+#Stores the level each corridor chain is generated for
+corridorLevels = [5, 10, 20, 30]
+#Stores the number of enemies each simulation benchmark is run with
+enemyCounts = [100, 500, 2000]
+#Level the simulation and drawing benchmarks are run on
+benchmarkLevel = 30
+#Number of ticks timed by each simulation benchmark
+simulationTicks = 300
+#Number of frames timed by each drawing benchmark
+drawFrames = 200
+
+#Runs a function a number of times, returning the median number of seconds it took
+def timeFunction(function, repeats):
+    durations = []
+    for i in range(repeats):
+        startTime = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - startTime)
+    return statistics.median(durations)
+
+#Sets the seed and level count that the game generates the next level from
+def setLevel(level):
+    game.runSeed = benchmarkSeed
+    game.levelCount = level
+
+#The game prints a line for every level it generates, which would get mixed up with the results
+def quietly(function, *args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args)
+
+def benchmarkGeneration(results, maxLevel, repeats):
+    for level in range(1, maxLevel + 1):
+        setLevel(level)
+        results["generateLevel " + str(level)] = timeFunction(lambda: quietly(game.generateLevel), repeats)
+
+def benchmarkAStar(results, repeats):
+    for size in aStarSizes:
+        #Scatters walls over a floor, walls can still be walked through at a higher cost
+        generator = random.Random(benchmarkSeed)
+        cells = bytearray(game.TileType.WALL if generator.random() < 0.3 else game.TileType.FLOOR for i in range(size * size))
+        #Searches from one corner of the grid's interior to the opposite one
+        start = size + 1
+        goal = size * (size - 1) - 2
+        search = lambda: pathfinding.aStar(cells, size, size, start, goal, game.costTable)
+        results["aStar " + str(size) + "x" + str(size)] = timeFunction(search, repeats)
+
+#Places a level's rooms without joining them, so the corridors can be timed on their own
+def placeRooms(level):
+    setLevel(level)
+    game.levelRandom.seed(game.getLevelSeed())
+    game.rooms = []
+    game.rows = 28 + 5 * level
+    game.columns = 28 + 5 * level
+    game.grid = game.Grid(game.columns, game.rows, game.TileType.WALL)
+
+    placer = game.RoomPlacer(game.columns, game.rows)
+    while game.generateRoom(placer) != "stop": pass
+
+def generateCorridors():
+    for i in range(1, len(game.rooms)):
+        game.generateCorridor(game.rooms[i], game.rooms[i - 1])
+
+def benchmarkCorridors(results, repeats):
+    for level in corridorLevels:
+        durations = []
+        for i in range(repeats):
+            #Corridors change the grid, so the rooms are placed again before every repeat
+            placeRooms(level)
+            startTime = time.perf_counter()
+            generateCorridors()
+            durations.append(time.perf_counter() - startTime)
+        results["generateCorridor chain level " + str(level)] = statistics.median(durations)
+
+#Starts the benchmark level with a set number of enemies spread across every room
+def startBenchmarkLevel(enemyCount):
+    setLevel(benchmarkLevel)
+    quietly(game.startLevel)
+    #The player cannot die, so enemies keep attacking for the whole benchmark
+    game.player.hitpoints = game.player.maxHitpoints = 10 ** 9
+
+    spawned = 0
+    while spawned < enemyCount:
+        spawnedBefore = spawned
+        for room in game.rooms:
+            if spawned == enemyCount: break
+            #Leaves at least one floor tile free in every room
+            if room.enemyCount >= len(room.floors) - 1: continue
+            if not room.active:
+                room.active = True
+                game.activeRooms.append(room)
+            spawnTile = room.getSpawnTile()
+            enemy = game.Enemy(spawnTile.x, spawnTile.y, "enemy", room)
+            #Every enemy hunts the player, even those the player has not seen
+            enemy.aware = 1
+            room.enemyCount += 1
+            enemy.occupy()
+            spawned += 1
+        #Stops once every room is full
+        if spawned == spawnedBefore: break
+    return spawned
+
+def benchmarkSimulation(results, repeats):
+    for enemyCount in enemyCounts:
+        durations = []
+        for i in range(repeats):
+            startBenchmarkLevel(enemyCount)
+            startTime = time.perf_counter()
+            for tick in range(simulationTicks):
+                game.update()
+            durations.append(time.perf_counter() - startTime)
+        #Stored as the time per tick so that a larger number is always worse
+        results["update " + str(enemyCount) + " enemies"] = statistics.median(durations) / simulationTicks
+
+def benchmarkDrawing(results, repeats):
+    startBenchmarkLevel(enemyCounts[0])
+
+    #Redraws the whole screen every frame, as happens whenever the player moves
+    def drawFullFrames():
+        for frame in range(drawFrames):
+            game.redrawScreen()
+            game.drawGame()
+
+    #Redraws only the areas that change while the player stands still
+    def drawChangedFrames():
+        for frame in range(drawFrames):
+            game.update()
+            game.drawGame()
+
+    results["drawGame full frame"] = timeFunction(drawFullFrames, repeats) / drawFrames
+    results["drawGame changed areas"] = timeFunction(drawChangedFrames, repeats) / drawFrames
+
+#Compares results to a baseline, returning the benchmarks which are slower by more than the threshold
+def findRegressions(results, baseline, threshold):
+    regressions = {}
+    for name, duration in results.items():
+        baselineDuration = baseline.get(name)
+        if not baselineDuration: continue
+        ratio = duration / baselineDuration
+        if ratio > 1 + threshold:
+            regressions[name] = ratio
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Times level generation, pathfinding, simulation and drawing.")
+    parser.add_argument("--output", help="file the results are saved to as JSON, which can be used as a baseline later")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="fraction a benchmark can be slower than the baseline by before it is reported")
+    parser.add_argument("--repeat", type=int, default=3, help="number of times each benchmark is run, the median time is kept")
+    parser.add_argument("--max-level", type=int, default=50, help="highest level that generation is timed for")
+    parser.add_argument("--only", choices=["generation", "astar", "corridors", "simulation", "drawing"], action="append",
+                        help="only run the given benchmarks, can be given more than once")
+    args = parser.parse_args()
+
+    game.initPygame(True)
+    #Levels must be generated every time rather than loaded from the cache
+    game.levelCacheEnabled = False
+
+    benchmarks = {
+        "generation" : lambda results: benchmarkGeneration(results, args.max_level, args.repeat),
+        "astar" : lambda results: benchmarkAStar(results, args.repeat),
+        "corridors" : lambda results: benchmarkCorridors(results, args.repeat),
+        "simulation" : lambda results: benchmarkSimulation(results, args.repeat),
+        "drawing" : lambda results: benchmarkDrawing(results, args.repeat)
+    }
+
+    #Stores the median number of seconds each benchmark took
+    results = {}
+    for name, benchmark in benchmarks.items():
+        if args.only and name not in args.only: continue
+        print("Running " + name + " benchmarks", file=sys.stderr)
+        benchmark(results)
+
+    report = {
+        "seed" : benchmarkSeed,
+        "python" : platform.python_version(),
+        "pygame" : pygame.version.ver,
+        "platform" : platform.platform(),
+        "results" : results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+
+    game.stopLevelPool()
+    pygame.quit()
+
+    if not args.baseline: return 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)["results"]
+    regressions = findRegressions(results, baseline, args.threshold)
+    for name, ratio in regressions.items():
+        print("Slower than baseline: " + name + " took " + format(ratio, ".2f") + "x as long", file=sys.stderr)
+    #Exits with an error when anything got slower, so the benchmarks can be used to catch regressions
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+import argparse, contextlib, importlib, io, multiprocessing, os, random, time
+from array import array
+from collections import OrderedDict
+
+#Selects SDL's dummy drivers before PyGame is initialised, so dungeons can be run
+#without a display or sound card
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+os.environ["SDL_AUDIODRIVER"] = "dummy"
+#Keeps PyGame's greeting out of the console, as every worker process would print it
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+
+#The game's file name has a space in it, so it has to be imported by name
+game = importlib.import_module("Dungeon Crawler")
+
+#Stores the names of every global of the game which belongs to a single dungeon. Each
+#environment keeps its own copy of these, and swaps them into the game while it is stepped
+dungeonStateNames = [
+    "grid", "rooms", "roomIndex", "activeRooms", "incompleteRoomCount", "enteredRoom", "entities", "enemyStore", "occupancy", "scheduler", "effects", "player",
+    "rows", "columns", "currentTick", "levelCount", "score", "damageTaken", "levelCompleted", "runSeed", "levelRandom",
+    "flowField", "flowFieldGrid", "flowFieldOrigin", "flowFieldReached",
+    "visibleTiles", "exploredTiles", "visibleList", "fieldOfViewOrigin", "fieldOfViewChanged",
+    "layerChunks", "keyMask", "generationTime"
+]
+
+#Stores the direction each action moves the player in, action 0 does nothing
+actionDirections = [None, game.directions["left"], game.directions["right"], game.directions["up"], game.directions["down"]]
+#Number of tiles in every direction from the player included in an observation
+defaultObservationRadius = 4
+#Tile type id observations use for the area outside the level
+outsideTile = game.TileType.BORDER
+
+#Initialises the game without a window the first time an environment is made
+def setupGame():
+    if game.screen: return
+    game.initPygame(True)
+    #Levels are always generated from their seed, so dungeons never touch the disk
+    game.levelCacheEnabled = False
+
+#The dungeon environment lets a program play a single dungeon, choosing the
+#player's action on every tick and observing the tiles around the player
+class DungeonEnv():
+    def __init__(self, observationRadius=defaultObservationRadius, maxSteps=None):
+        setupGame()
+        self.observationRadius = observationRadius
+        self.observationSize = (2 * observationRadius + 1) ** 2
+        #Stops an episode after this many steps, even if the player is still alive
+        self.maxSteps = maxSteps
+        #Stores the dungeon's copy of the game's globals, None until the environment is reset
+        self.state = None
+        self.action = 0
+        self.steps = 0
+
+    #Swaps the dungeon's state into the game
+    def activate(self):
+        for name, value in self.state.items():
+            setattr(game, name, value)
+        game.directionProvider = self.getDirection
+
+    #Takes the dungeon's state back out of the game once it has been stepped
+    def deactivate(self):
+        self.state = {name : getattr(game, name) for name in dungeonStateNames}
+
+    #Called by the game to decide the player's direction for the tick
+    def getDirection(self, player):
+        return actionDirections[self.action]
+
+    #Starts a new game from a seed, returning the first observation
+    def reset(self, seed):
+        #Everything the game changes in place is replaced, so no other dungeon's state is changed
+        game.levelRandom = random.Random()
+        game.flowField = None
+        game.flowFieldGrid = None
+        game.flowFieldOrigin = None
+        game.flowFieldReached = []
+        game.visibleList = []
+        game.layerChunks = OrderedDict()
+        game.activeRooms = []
+        game.directionProvider = self.getDirection
+        self.action = 0
+        self.steps = 0
+
+        #The game prints the seed and every level it generates
+        with contextlib.redirect_stdout(io.StringIO()):
+            game.startRun(seed)
+            game.startLevel()
+
+        observation = self.getObservation()
+        self.deactivate()
+        return observation
+
+    #Plays a single tick with the given action, returning the observation afterwards, the score
+    #gained during the tick, whether the episode has finished and details of the game's state
+    def step(self, action):
+        self.activate()
+        self.action = action
+        scoreBefore = game.score
+
+        done = False
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                game.update()
+        except game.GameOver:
+            done = True
+        self.steps += 1
+        if self.maxSteps and self.steps >= self.maxSteps:
+            done = True
+
+        reward = game.score - scoreBefore
+        observation = self.getObservation()
+        info = {"levelCount" : game.levelCount, "score" : game.score, "hitpoints" : game.player.hitpoints,
+                "damageTaken" : game.damageTaken, "steps" : self.steps}
+        self.deactivate()
+        return observation, reward, done, info
+
+    #Gets the tile type id of every tile around the player, row by row, with
+    #the player and enemies shown by their own tile type ids
+    def getObservation(self):
+        radius = self.observationRadius
+        player = game.player
+        observation = bytearray([outsideTile]) * self.observationSize
+
+        i = 0
+        for y in range(player.y - radius, player.y + radius + 1):
+            for x in range(player.x - radius, player.x + radius + 1):
+                if 0 <= x < game.columns and 0 <= y < game.rows:
+                    entity = game.occupancy.get((x, y))
+                    if entity:
+                        observation[i] = game.tileTypeIds[entity.tileType]
+                    else:
+                        observation[i] = game.grid.getType(x, y)
+                i += 1
+        return observation
+
+#The vector dungeon environment steps many dungeons in lockstep. Their observations are
+#returned as one bytearray, each dungeon's observation following the one before.
+#Dungeons whose episode has finished are reset straight away with a new seed
+class VectorDungeonEnv():
+    def __init__(self, count, observationRadius=defaultObservationRadius, maxSteps=None, workers=0, seedStride=None):
+        self.count = count
+        #Stores how far the seed of a dungeon moves on each time it is reset, which is the
+        #total number of dungeons so that no two dungeons ever play the same seed
+        self.seedStride = seedStride or count
+        self.observationSize = (2 * observationRadius + 1) ** 2
+        self.seeds = [0] * count
+        self.workers = []
+        self.envs = []
+
+        if not workers:
+            self.envs = [DungeonEnv(observationRadius, maxSteps) for i in range(count)]
+            return
+
+        #Splits the dungeons between worker processes, which each step their share of them
+        context = multiprocessing.get_context("spawn")
+        self.workerCounts = [count // workers + (1 if i < count % workers else 0) for i in range(workers)]
+        for workerCount in self.workerCounts:
+            if not workerCount: continue
+            connection, workerConnection = context.Pipe()
+            process = context.Process(target=runWorker, args=(workerConnection, workerCount, observationRadius, maxSteps, count), daemon=True)
+            process.start()
+            self.workers.append((process, connection, workerCount))
+
+    #Starts every dungeon from the seeds given, or from consecutive seeds when a single seed is given
+    def reset(self, seeds):
+        if isinstance(seeds, int):
+            seeds = list(range(seeds, seeds + self.count))
+        self.seeds = list(seeds)
+
+        if self.workers:
+            start = 0
+            for process, connection, workerCount in self.workers:
+                connection.send(("reset", self.seeds[start:start + workerCount]))
+                start += workerCount
+            return self.joinObservations([connection.recv() for process, connection, workerCount in self.workers])
+
+        observations = bytearray()
+        for env, seed in zip(self.envs, self.seeds):
+            observations += env.reset(seed)
+        return observations
+
+    #Plays a tick of every dungeon with one action each, returning their observations,
+    #rewards, whether each episode finished and the details of every dungeon
+    def step(self, actions):
+        if self.workers:
+            start = 0
+            for process, connection, workerCount in self.workers:
+                connection.send(("step", actions[start:start + workerCount]))
+                start += workerCount
+            results = [connection.recv() for process, connection, workerCount in self.workers]
+            observations = self.joinObservations([result[0] for result in results])
+            rewards = array("i")
+            dones = bytearray()
+            infos = []
+            for result in results:
+                rewards.extend(result[1])
+                dones.extend(result[2])
+                infos.extend(result[3])
+            return observations, rewards, dones, infos
+
+        observations = bytearray()
+        rewards = array("i")
+        dones = bytearray()
+        infos = []
+        for i, env in enumerate(self.envs):
+            observation, reward, done, info = env.step(actions[i])
+            if done:
+                #Carries on with a seed no other dungeon has used
+                self.seeds[i] += self.seedStride
+                observation = env.reset(self.seeds[i])
+            observations += observation
+            rewards.append(reward)
+            dones.append(done)
+            infos.append(info)
+        return observations, rewards, dones, infos
+
+    def joinObservations(self, parts):
+        observations = bytearray()
+        for part in parts:
+            observations += part
+        return observations
+
+    #Stops every worker process
+    def close(self):
+        for process, connection, workerCount in self.workers:
+            connection.send(("close", None))
+            process.join()
+        self.workers = []
+
+#Runs within a worker process, stepping a share of a vector environment's dungeons when asked to
+def runWorker(connection, count, observationRadius, maxSteps, seedStride):
+    envs = VectorDungeonEnv(count, observationRadius, maxSteps, seedStride=seedStride)
+    while True:
+        command, data = connection.recv()
+        if command == "reset":
+            connection.send(envs.reset(data))
+        elif command == "step":
+            connection.send(envs.step(data))
+        else:
+            break
+
+#Steps many dungeons with random actions and reports how many steps were played every second
+def main():
+    parser = argparse.ArgumentParser(description="Measures how quickly many dungeons can be stepped without a window.")
+    parser.add_argument("--dungeons", type=int, default=64, help="number of dungeons stepped in lockstep")
+    parser.add_argument("--steps", type=int, default=1000, help="number of times every dungeon is stepped")
+    parser.add_argument("--workers", type=int, default=0, help="number of worker processes the dungeons are split between")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first dungeon, each dungeon after uses the next seed")
+    args = parser.parse_args()
+
+    envs = VectorDungeonEnv(args.dungeons, workers=args.workers)
+    envs.reset(args.seed)
+
+    actionRandom = random.Random(args.seed)
+    episodes = 0
+    startTime = time.perf_counter()
+    for step in range(args.steps):
+        actions = [actionRandom.randrange(len(actionDirections)) for i in range(args.dungeons)]
+        observations, rewards, dones, infos = envs.step(actions)
+        episodes += sum(dones)
+    elapsed = time.perf_counter() - startTime
+    envs.close()
+
+    totalSteps = args.dungeons * args.steps
+    print("Played " + str(totalSteps) + " steps in " + str(round(elapsed, 3)) + "s, " + str(episodes) + " episodes finished")
+    print("Steps per second: " + str(round(totalSteps / max(elapsed, 1e-9))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import heapq
+
+#Stores the change in x and y of each of the four
+#directions a path can move in
+directionOffsets = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+#Stores a mask for every grid size that has been searched, which
+#holds 1 for tiles that paths may pass through and 0 for the
+#outermost ring of tiles which paths must stay out of
+interiorMasks = {}
+
+def getInteriorMask(columns, rows):
+    key = (columns, rows)
+    mask = interiorMasks.get(key)
+    if mask: return mask
+
+    mask = bytearray(columns * rows)
+    #Marks every row apart from the first and last one, leaving
+    #out the first and last tile of each row
+    interiorRow = b"\x01" * (columns - 2)
+    for row in range(1, rows - 1):
+        start = row * columns + 1
+        mask[start:start + columns - 2] = interiorRow
+
+    interiorMasks[key] = mask
+    return mask
+
+#Finds the cheapest path between two tiles of a grid. Tiles are referred to
+#by their index within cells, a flat sequence of tile type ids stored row by
+#row, and costTable gives the cost of walking onto each tile type id.
+#Returns a dictionary mapping each reached tile to the tile it was reached
+#from (the start tile maps to None) along with the tile next to the goal
+#that the path ends on, or None if the goal cannot be reached
+def aStar(cells, columns, rows, start, goal, costTable):
+    mask = getInteriorMask(columns, rows)
+    #Converts each direction into the change in tile index it causes
+    offsets = [(dx + dy * columns, dx, dy) for dx, dy in directionOffsets]
+    goalY, goalX = divmod(goal, columns)
+
+    #The frontier is a heap of (priority, cost, tile, x, y) tuples
+    startY, startX = divmod(start, columns)
+    frontier = [(abs(startX - goalX) + abs(startY - goalY), 0, start, startX, startY)]
+
+    cameFrom = {start: None}
+    costSoFar = {start: 0}
+
+    while frontier:
+        priority, cost, current, x, y = heapq.heappop(frontier)
+        #Skips tiles which have since been reached more cheaply
+        if cost > costSoFar[current]: continue
+
+        for offset, dx, dy in offsets:
+            nextTile = current + offset
+            if nextTile == goal: return cameFrom, current
+            if not mask[nextTile]: continue
+
+            newCost = cost + costTable[cells[nextTile]]
+            if nextTile not in costSoFar or newCost < costSoFar[nextTile]:
+                costSoFar[nextTile] = newCost
+                cameFrom[nextTile] = current
+
+                #The manhattan distance never overestimates the remaining cost
+                #as every tile costs at least 1 to walk onto
+                nextX = x + dx
+                nextY = y + dy
+                priority = newCost + abs(nextX - goalX) + abs(nextY - goalY)
+                heapq.heappush(frontier, (priority, newCost, nextTile, nextX, nextY))
+
+    return cameFrom, None
@@ -0,0 +1,46 @@
+import heapq
+
+#The timer wheel wakes up items on the tick they are scheduled for. Items due within
+#the next slotCount ticks are kept in a ring of lists, one list for each tick, so
+#scheduling an item and finding the items due on a tick only touches a single list.
+#Items scheduled further ahead wait in a heap until they come within reach of the wheel
+class TimerWheel():
+    def __init__(self, tick=0, slotCount=256):
+        #The number of slots must be a power of 2 so a tick's slot can be found with a mask
+        self.slotCount = slotCount
+        self.mask = slotCount - 1
+        self.slots = [[] for i in range(slotCount)]
+        #Stores (tick, order, item) for every item too far ahead to fit on the wheel
+        self.overflow = []
+        self.overflowCount = 0
+        #Stores the first tick which has not been woken yet
+        self.tick = tick
+
+    #Wakes up an item on the given tick, or on the next tick to be woken if the tick has passed
+    def schedule(self, tick, item):
+        if tick < self.tick:
+            tick = self.tick
+        if tick - self.tick < self.slotCount:
+            self.slots[tick & self.mask].append(item)
+        else:
+            #The order keeps items due on the same tick in the order they were scheduled
+            heapq.heappush(self.overflow, (tick, self.overflowCount, item))
+            self.overflowCount += 1
+
+    #Moves the wheel on to the given tick, returning every item due
+    #up to and including it in the order they are due
+    def advance(self, tick):
+        dueItems = []
+        while self.tick <= tick:
+            slot = self.tick & self.mask
+            if self.slots[slot]:
+                dueItems.extend(self.slots[slot])
+                self.slots[slot] = []
+            self.tick += 1
+
+            #The slot just emptied now stands for the tick slotCount ticks ahead
+            overflow = self.overflow
+            while overflow and overflow[0][0] - self.tick < self.slotCount:
+                dueTick, order, item = heapq.heappop(overflow)
+                self.slots[dueTick & self.mask].append(item)
+        return dueItems
@@ -0,0 +1,60 @@
+#Stores how the x and y of each of the eight octants around the viewer are
+#worked out from a tile's position within the octant, as (xx, xy, yx, yy)
+octantTransforms = [
+    (1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+    (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1)
+]
+
+#Finds every tile that can be seen from a tile of a grid using recursive shadowcasting.
+#Tiles are referred to by their index within cells, a flat sequence of tile type ids
+#stored row by row, and opaqueTable holds 1 for every tile type id that blocks sight.
+#Sight reaches radius tiles in every direction, so the area that can be seen is a square.
+#Returns the index of every tile that can be seen, including the tiles that block sight
+def getVisibleTiles(cells, columns, rows, originX, originY, radius, opaqueTable):
+    visible = {originY * columns + originX}
+    for transform in octantTransforms:
+        castLight(cells, columns, rows, originX, originY, radius, opaqueTable, transform, 1, 1.0, 0.0, visible)
+    return visible
+
+#Scans an octant row by row moving away from the viewer, between the start and end slopes.
+#Whenever a tile blocks sight the rest of the row beyond it is scanned by a separate call
+def castLight(cells, columns, rows, originX, originY, radius, opaqueTable, transform, row, start, end, visible):
+    if start < end: return
+    xx, xy, yx, yy = transform
+
+    newStart = 0.0
+    for distance in range(row, radius + 1):
+        blocked = False
+        for dx in range(-distance, 1):
+            dy = -distance
+            #Stores the slopes of the edges of the tile closest to and furthest from the start of the scan
+            leftSlope = (dx - 0.5) / (dy + 0.5)
+            rightSlope = (dx + 0.5) / (dy - 0.5)
+            if start < rightSlope: continue
+            if end > leftSlope: break
+
+            x = originX + dx * xx + dy * xy
+            y = originY + dx * yx + dy * yy
+            #Tiles outside the grid block sight
+            if 0 <= x < columns and 0 <= y < rows:
+                index = y * columns + x
+                visible.add(index)
+                opaque = opaqueTable[cells[index]]
+            else:
+                opaque = True
+
+            if blocked:
+                #Carries on through the shadow until a tile that does not block sight is found
+                if opaque:
+                    newStart = rightSlope
+                    continue
+                blocked = False
+                start = newStart
+            elif opaque and distance < radius:
+                #Scans the part of the octant beyond the tiles before this one
+                blocked = True
+                castLight(cells, columns, rows, originX, originY, radius, opaqueTable, transform, distance + 1, start, leftSlope, visible)
+                newStart = rightSlope
+
+        #The rest of the octant is in shadow
+        if blocked: break